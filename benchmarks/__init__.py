@@ -0,0 +1,7 @@
+"""
+Package: benchmarks
+Performance benchmarks for the inventory service
+
+The benchmarks are plain scripts run with python -m and are not collected
+by the unit test runner.
+"""
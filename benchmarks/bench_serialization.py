@@ -0,0 +1,89 @@
+"""
+Serialization benchmark
+
+Encodes a 10k row product list the old way (ORM objects, serialize(),
+flask-restx marshal() and json.dumps) and the new way (Core rows straight
+through the RowEncoder), reporting the median time of each.
+
+Usage:
+  python -m benchmarks.bench_serialization --rows 10000 --repeat 20
+"""
+import argparse
+import json
+import statistics
+from datetime import date, timedelta
+from benchmarks.common import add_database_argument, insert_batches, load_service, timings
+
+
+def parse_args():
+    """Parses the command line"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=10000, help="rows to encode")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per encoder")
+    add_database_argument(parser, "sqlite:///:memory:")
+    return parser.parse_args()
+
+
+def timed(function, repeat):
+    """Returns the median run time of function in milliseconds"""
+    return statistics.median(timings(function, repeat))
+
+
+def main():
+    """Runs the benchmark and prints a before/after table"""
+    args = parse_args()
+    app, db = load_service(args.database_uri)
+    # pylint: disable=import-outside-toplevel
+    from flask_restx import marshal
+    from service.models import Inventory, Condition, row_encoder
+    from service.common.encoder import RowEncoder
+    from service.routes import inventory_model
+
+    start = date(2020, 1, 1)
+    insert_batches(
+        db,
+        Inventory,
+        args.rows,
+        lambda iid: {
+            "id": iid,
+            "name": f"item-{iid}",
+            "quantity": iid % 100,
+            "restock_level": 10,
+            "restock_count": 50,
+            "condition": list(Condition)[iid % len(Condition)],
+            "first_entry_date": start,
+            "last_restock_date": start + timedelta(days=iid % 365),
+        },
+    )
+
+    def old_path():
+        products = Inventory.query.order_by(Inventory.id).limit(args.rows).all()
+        results = marshal([product.serialize() for product in products], inventory_model)
+        return json.dumps(results).encode("utf-8")
+
+    def new_path(encoder):
+        return encoder.encode_rows(Inventory.find_page(args.rows))
+
+    stdlib_encoder = RowEncoder(
+        enum_fields=("condition",),
+        date_fields=("first_entry_date", "last_restock_date"),
+        use_orjson=False,
+    )
+    with app.app_context():
+        if json.loads(old_path()) != json.loads(new_path(stdlib_encoder)):
+            raise RuntimeError("The row encoder does not produce the same list as marshal()")
+        results = {
+            "ORM + serialize + marshal + json": timed(old_path, args.repeat),
+            "rows + RowEncoder (json)": timed(lambda: new_path(stdlib_encoder), args.repeat),
+        }
+        if row_encoder.use_orjson:
+            results["rows + RowEncoder (orjson)"] = timed(lambda: new_path(row_encoder), args.repeat)
+
+    print(f"{'encoder':40} {'p50 ms':>10} {'speedup':>8}")
+    baseline = next(iter(results.values()))
+    for name, median in results.items():
+        print(f"{name:40} {median:10.1f} {baseline / median:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark helpers
+
+Command line, database setup, seeding and timing code shared by the
+benchmark scripts. Every script drops the inventory table of the database it
+is given, so only databases whose name contains "bench", or an in-memory
+SQLite database, are accepted.
+"""
+import argparse
+import logging
+import os
+import time
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import ArgumentError
+
+BATCH_SIZE = 10000
+
+
+def bench_database_uri(value) -> str:
+    """Returns value when it names a database the benchmarks may drop tables from"""
+    try:
+        database = make_url(value).database or ""
+    except ArgumentError as error:
+        raise argparse.ArgumentTypeError(f"not a database URI: {value}") from error
+    if database != ":memory:" and "bench" not in os.path.basename(database):
+        raise argparse.ArgumentTypeError(
+            f"refusing to drop the tables of {database or value}; use a database whose name contains 'bench'"
+        )
+    return value
+
+
+def add_database_argument(parser, default):
+    """Adds --database-uri, which ignores DATABASE_URI so a real database is never dropped by accident"""
+    parser.add_argument(
+        "--database-uri",
+        default=default,
+        type=bench_database_uri,
+        help=f"database to seed, its name must contain 'bench'; its inventory table is dropped first [{default}]",
+    )
+
+
+def load_service(database_uri, log_level=logging.WARNING):
+    """Imports the service on database_uri and returns (app, db) with empty tables"""
+    os.environ["DATABASE_URI"] = database_uri
+    # the service reads DATABASE_URI into its config when it is imported
+    # pylint: disable=import-outside-toplevel
+    from service import app
+    from service.models import db
+
+    app.logger.setLevel(log_level)
+    db.drop_all()
+    db.create_all()
+    return app, db
+
+
+def insert_batches(db, table, rows, make_row):
+    """Inserts make_row(id) for the ids 1 to rows, committing every BATCH_SIZE rows"""
+    for first in range(1, rows + 1, BATCH_SIZE):
+        batch = [make_row(iid) for iid in range(first, min(first + BATCH_SIZE, rows + 1))]
+        db.session.execute(db.insert(table), batch)
+        db.session.commit()
+
+
+def timings(function, repeat, warmup=0) -> list:
+    """Returns the sorted run times in milliseconds of repeated calls to function"""
+    for _ in range(warmup):
+        function()
+    results = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        results.append((time.perf_counter() - started) * 1000)
+    return sorted(results)
+
+
+def expect(response, code=200):
+    """Fails the run when a route returns an unexpected status
+
+    An explicit check rather than assert, which python -O skips.
+    """
+    if response.status_code != code:
+        raise RuntimeError(f"{response.request.path} returned {response.status_code}, expected {code}")
+    return response
@@ -0,0 +1,286 @@
+"""
+HTTP load generator
+
+Replays a weighted mix of the inventory endpoints against a running server,
+for example a local gunicorn, and reports the throughput and the p50, p95
+and p99 latency of each endpoint. Every virtual user keeps one HTTP/1.1
+keep-alive connection open, so the numbers measure the service and not the
+TCP handshake. Item ids are drawn with a hot-key skew: --hot-share of the
+requests go to the first --hot-keys fraction of the ids.
+
+Usage:
+  flask db-init
+  gunicorn --workers 2 --bind 0.0.0.0:8000 service:app
+  python -m benchmarks.loadgen --profile mixed --users 32 --duration 60 --setup
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+# Share of requests sent to each endpoint
+PROFILES = {
+    "read-heavy": {"get": 80, "list": 15, "create": 1, "put": 2, "restock": 2},
+    "mixed": {"get": 55, "list": 15, "create": 10, "put": 10, "restock": 10},
+    "write-heavy": {"get": 20, "list": 5, "create": 25, "put": 25, "restock": 25},
+}
+CONDITIONS = ("NEW", "OPEN_BOX", "USED")
+SETUP_BATCH = 500
+
+
+def parse_args():
+    """Parses the command line"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default=os.getenv("BASE_URL", "http://localhost:8000"), help="server to load")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="mixed", help="mix of endpoints")
+    parser.add_argument("--users", type=int, default=16, help="concurrent connections")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    parser.add_argument("--rate", type=float, default=0, help="total requests per second, 0 for as fast as possible")
+    parser.add_argument("--keys", type=int, default=10000, help="item ids 1..keys the requests use")
+    parser.add_argument("--hot-keys", type=float, default=0.01, help="fraction of the ids that are hot")
+    parser.add_argument("--hot-share", type=float, default=0.8, help="fraction of the requests to hot ids")
+    parser.add_argument("--setup", action="store_true", help="create the ids 1..keys before the run")
+    parser.add_argument("--seed", type=int, help="random seed, for a repeatable request sequence")
+    parser.add_argument("--output", help="file to write the report to as JSON")
+    return parser.parse_args()
+
+
+def product(iid, rng):
+    """Returns a product document for the create and update endpoints"""
+    return {
+        "id": iid,
+        "name": f"load-{iid}",
+        "quantity": rng.randint(0, 100),
+        "restock_level": rng.randint(0, 20),
+        "restock_count": rng.randint(10, 50),
+        "condition": rng.choice(CONDITIONS),
+        "first_entry_date": "2023-01-01",
+        "last_restock_date": "2023-06-01",
+    }
+
+
+class Connection:
+    """A keep-alive HTTP/1.1 connection that sends one request at a time"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, body=None) -> tuple:
+        """Sends a request and returns the status code and the response body"""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+        payload = b""
+        if body is not None:
+            payload = json.dumps(body).encode("utf-8")
+            head += "Content-Type: application/json\r\n"
+        head += f"Content-Length: {len(payload)}\r\n\r\n"
+        try:
+            self.writer.write(head.encode("latin-1") + payload)
+            return await self._response()
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            self.close()
+            raise
+
+    async def _response(self) -> tuple:
+        status_line = await self.reader.readuntil(b"\r\n")
+        code = int(status_line.split(b" ", 2)[1])
+        headers = {}
+        while True:
+            line = await self.reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = b""
+            while True:
+                size = int((await self.reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                body += await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            body = await self.reader.readexactly(int(headers.get("content-length", 0)))
+        if headers.get("connection", "").lower() == "close":
+            self.close()
+        return code, body
+
+    def close(self):
+        """Closes the socket; the next request opens a new one"""
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+class Workload:
+    """Picks the next request of a profile with a hot-key skew"""
+
+    def __init__(self, args, rng):
+        self.rng = rng
+        self.keys = args.keys
+        self.hot = max(1, int(args.keys * args.hot_keys))
+        self.hot_share = args.hot_share
+        self.endpoints = list(PROFILES[args.profile])
+        self.weights = list(PROFILES[args.profile].values())
+        # created ids start at a block of a million chosen by the clock, so
+        # repeated runs rarely collide and stay within a 32 bit integer
+        self.next_id = args.keys + int(time.time()) % 1000 * 1000000
+
+    def item_id(self) -> int:
+        """Returns an existing id, hot ones with probability hot_share"""
+        if self.rng.random() < self.hot_share:
+            return self.rng.randint(1, self.hot)
+        return self.rng.randint(1, self.keys)
+
+    def next_request(self) -> tuple:
+        """Returns the (endpoint, method, path, body) of the next request"""
+        endpoint = self.rng.choices(self.endpoints, self.weights)[0]
+        if endpoint == "get":
+            return endpoint, "GET", f"/api/inventory/{self.item_id()}", None
+        if endpoint == "list":
+            filters = self.rng.choice([
+                f"condition={self.rng.choice(CONDITIONS)}&quantity={self.rng.randint(0, 100)}",
+                f"name=load-{self.item_id()}",
+                f"quantity__lt={self.rng.randint(1, 10)}&limit=50",
+            ])
+            return endpoint, "GET", f"/api/inventory?{filters}", None
+        if endpoint == "create":
+            self.next_id += 1
+            return endpoint, "POST", "/api/inventory", product(self.next_id, self.rng)
+        iid = self.item_id()
+        if endpoint == "put":
+            return endpoint, "PUT", f"/api/inventory/{iid}", product(iid, self.rng)
+        return endpoint, "PUT", f"/api/inventory/{iid}/restock", None
+
+
+async def setup(host, port, keys, rng):
+    """Creates the products 1..keys, skipping the ones that exist"""
+    connection = Connection(host, port)
+    for first in range(1, keys + 1, SETUP_BATCH):
+        batch = [product(iid, rng) for iid in range(first, min(first + SETUP_BATCH, keys + 1))]
+        code, _ = await connection.request("POST", "/api/inventory/bulk", batch)
+        if code != 200:
+            raise SystemExit(f"Setup failed with status {code}")
+    connection.close()
+
+
+async def user(host, port, workload, deadline, interval, samples, errors):
+    """Sends requests on one connection until the deadline"""
+    connection = Connection(host, port)
+    next_start = time.perf_counter()
+    while True:
+        if interval:
+            next_start += interval
+        now = time.perf_counter()
+        if now >= deadline:
+            break
+        endpoint, method, path, body = workload.next_request()
+        started = time.perf_counter()
+        try:
+            code, _ = await connection.request(method, path, body)
+        except (OSError, asyncio.IncompleteReadError, ValueError) as error:
+            errors[endpoint][type(error).__name__] += 1
+            await asyncio.sleep(0.1)
+            continue
+        samples[endpoint].append(time.perf_counter() - started)
+        if code >= 500 or code in (400, 412):
+            errors[endpoint][str(code)] += 1
+        if interval and next_start > time.perf_counter():
+            await asyncio.sleep(next_start - time.perf_counter())
+    connection.close()
+
+
+def percentile(ordered, fraction) -> float:
+    """Returns a percentile of sorted samples, in milliseconds"""
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000
+
+
+def summarize(samples, errors, elapsed) -> dict:
+    """Returns the throughput and latency of each endpoint and of all of them"""
+    report = {}
+    everything = []
+    all_errors = defaultdict(int)
+    for endpoint in sorted(set(samples) | set(errors)):
+        ordered = sorted(samples[endpoint])
+        everything.extend(ordered)
+        report[endpoint] = summary(ordered, errors[endpoint], elapsed)
+        for kind, count in errors[endpoint].items():
+            all_errors[kind] += count
+    report["all"] = summary(sorted(everything), all_errors, elapsed)
+    return report
+
+
+def summary(ordered, errors, elapsed) -> dict:
+    """Returns the statistics of one set of sorted samples"""
+    if not ordered:
+        return {"requests": 0, "errors": dict(errors)}
+    return {
+        "requests": len(ordered),
+        "rps": round(len(ordered) / elapsed, 1),
+        "p50_ms": round(percentile(ordered, 0.50), 2),
+        "p95_ms": round(percentile(ordered, 0.95), 2),
+        "p99_ms": round(percentile(ordered, 0.99), 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 2),
+        "errors": dict(errors),
+    }
+
+
+async def run(args) -> dict:
+    """Runs the load and returns the report"""
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    rng = random.Random(args.seed)
+    if args.setup:
+        print(f"Creating products 1..{args.keys}...")
+        await setup(host, port, args.keys, rng)
+    workload = Workload(args, rng)
+    samples = defaultdict(list)
+    errors = defaultdict(lambda: defaultdict(int))
+    interval = args.users / args.rate if args.rate else 0
+    print(f"Running the {args.profile} profile with {args.users} users for {args.duration:g}s...")
+    started = time.perf_counter()
+    deadline = started + args.duration
+    await asyncio.gather(*[
+        user(host, port, workload, deadline, interval, samples, errors) for _ in range(args.users)
+    ])
+    elapsed = time.perf_counter() - started
+    return {
+        "profile": args.profile,
+        "users": args.users,
+        "duration_s": round(elapsed, 2),
+        "endpoints": summarize(samples, errors, elapsed),
+    }
+
+
+def main():
+    """Runs the load generator and prints a table per endpoint"""
+    args = parse_args()
+    report = asyncio.run(run(args))
+    print(f"{'endpoint':10} {'requests':>9} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}  errors")
+    for endpoint, result in report["endpoints"].items():
+        if not result["requests"]:
+            print(f"{endpoint:10} {0:9}  {result['errors']}")
+            continue
+        print(
+            f"{endpoint:10} {result['requests']:9} {result['rps']:8.1f} {result['p50_ms']:8.2f}"
+            f" {result['p95_ms']:8.2f} {result['p99_ms']:8.2f} {result['max_ms']:8.2f}  {result['errors'] or ''}"
+        )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    if report["endpoints"]["all"]["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""
+Gunicorn configuration
+
+Loaded by gunicorn from the working directory. When PROMETHEUS_MULTIPROC_DIR
+is set the workers share their metrics through files in that directory,
+which has to be emptied when the server starts and told when a worker exits.
+The directory may be a mounted volume, so only its files are removed.
+"""
+import os
+
+
+def on_starting(server):  # pylint: disable=unused-argument
+    """Clears the metrics left by a previous run"""
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+
+
+def child_exit(server, worker):  # pylint: disable=unused-argument
+    """Drops the live gauges of a worker that exited"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess  # pylint: disable=import-outside-toplevel
+
+        multiprocess.mark_process_dead(worker.pid)
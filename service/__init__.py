@@ -8,7 +8,7 @@ import sys
 from flask import Flask
 from flask_restx import Api
 from service import config
-from service.common import log_handlers
+from service.common import log_handlers, metrics, sql_timing
 
 # Create Flask application
 app = Flask(__name__)
@@ -39,13 +39,17 @@ from service.common import error_handlers, cli_commands  # noqa: F401, E402
 
 # Set up logging for production
 log_handlers.init_logging(app, "gunicorn.error")
+metrics.init_metrics(app)
+sql_timing.init_sql_timing(app)
+# after the hooks above, so failed requests are still measured
+app.before_request(routes.wait_for_database)
 
 app.logger.info(70 * "*")
 app.logger.info("  S E R V I C E   R U N N I N G  ".center(70, "*"))
 app.logger.info(70 * "*")
 
 try:
-    models.init_db(app)  # make our SQLAlchemy tables
+    models.init_db(app)  # the tables are made by flask db-init
 except Exception as error:  # pylint: disable=broad-except
     app.logger.critical("%s: Cannot continue", error)
     # gunicorn requires exit code 4 to stop spawning workers when they die
@@ -0,0 +1,270 @@
+"""
+ASGI application
+
+Serves the inventory REST API from an event loop, so one process keeps many
+database calls in flight instead of blocking a worker on each. The item and
+collection routes (GET, PUT and DELETE of an item, listing, creating and
+restocking) run as coroutines on the async methods of Inventory, which
+execute the same statements as the sync ones on an async engine (asyncpg
+for PostgreSQL, aiosqlite for SQLite). Every other path is passed on to the
+Flask app, so the REST contract is the same in both modes. Like the Flask
+app, the routes wait for the database before the first request that needs it
+and answer 503 while it cannot be reached.
+
+Run it with:
+  uvicorn --workers 2 --port 8000 service.asgi:app
+"""
+import contextlib
+import functools
+import json
+from urllib.parse import urlencode
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import parse_etags, quote_etag
+from flask import abort
+from service import app as flask_app
+from service.common import conditional, status
+from service.common.cache import item_cache
+from service.common.conditional import content_etag, item_etag, precondition_failed
+from service.models import Inventory, DataValidationError, DatabaseConnectionError, row_encoder
+from service.routes import decode_cursor, encode_cursor, item_key, page_limit, parse_fields, stored_id
+
+logger = flask_app.logger
+
+# Starlette responses from the helpers shared with the Flask routes
+json_response = functools.partial(conditional.json_response, Response)
+not_modified = functools.partial(conditional.not_modified, Response)
+
+
+def needs_database(endpoint):
+    """Waits for the database before an endpoint runs, like routes.wait_for_database()
+
+    Until a worker has reached the database, the check runs the Flask app's
+    bounded retries in a thread, so the event loop is not blocked.
+    """
+
+    @functools.wraps(endpoint)
+    async def wrapper(request):
+        if not Inventory.ready:
+            await run_in_threadpool(wait_for_db)
+        return await endpoint(request)
+
+    return wrapper
+
+
+def wait_for_db():
+    """Runs Inventory.wait_for_db() with the retry settings of the Flask app"""
+    with flask_app.app_context():
+        Inventory.wait_for_db(
+            flask_app.config["RETRY_COUNT"], flask_app.config["RETRY_DELAY"], flask_app.config["RETRY_MAX_DELAY"]
+        )
+
+
+######################################################################
+#  PATH: /api/inventory/{id}
+######################################################################
+@needs_database
+async def get_item(request: Request):
+    """Returns the product with an id, or 304 while its ETag is unchanged"""
+    iid = item_key(request.path_params["iid"])
+    logger.info("Request to get product with id %s...", iid)
+    fields = parse_fields(request.query_params.get("fields"))
+    if fields is not None:
+        return await get_item_fields(request, iid, fields)
+    cached = item_cache.get(iid)
+    if cached is None:
+        generation = item_cache.generation()
+        product = await Inventory.find_async(iid)
+        if product is None:
+            abort(status.HTTP_404_NOT_FOUND, f"Product {iid} does not exist")
+        cached = (item_etag(product), row_encoder.dumps(product.serialize()))
+        item_cache.put(iid, cached, generation)
+    etag, body = cached
+    if parse_etags(request.headers.get("if-none-match")).contains_weak(etag):
+        return not_modified(etag)
+    return json_response(body, status.HTTP_200_OK, {"ETag": quote_etag(etag)})
+
+
+async def get_item_fields(request, iid, fields):
+    """Returns a product narrowed to some of its fields"""
+    row = await Inventory.find_fields_async(iid, fields)
+    if row is None:
+        abort(status.HTTP_404_NOT_FOUND, f"Product {iid} does not exist")
+    etag = f"{item_etag(row)}-{'.'.join(fields)}"
+    if parse_etags(request.headers.get("if-none-match")).contains_weak(etag):
+        return not_modified(etag)
+    product = row_encoder.to_dicts([row])[0]
+    del product["version"], product["updated_at"]
+    return json_response(row_encoder.dumps(product), status.HTTP_200_OK, {"ETag": quote_etag(etag)})
+
+
+@needs_database
+async def put_item(request: Request):
+    """Updates a product, or creates it with ?upsert=true"""
+    iid = item_key(request.path_params["iid"])
+    logger.info("Request to update product with id: %s", iid)
+    product = Inventory().deserialize(await json_body(request))
+    product.id = iid
+    versions = conditional.if_match_versions(request.headers.get("if-match"))
+    if versions is None and request.query_params.get("upsert", "").lower() == "true":
+        product = await product.upsert_async()
+        headers = {"ETag": quote_etag(item_etag(product))}
+        code = status.HTTP_200_OK
+        if product.version == 1:
+            code = status.HTTP_201_CREATED
+            headers["Location"] = str(request.url_for("inventory_resource", iid=product.id))
+        return json_response(row_encoder.dumps(product.serialize()), code, headers)
+    product = await product.replace_async(versions)
+    if product is None:
+        if versions is not None:
+            precondition_failed(iid, await Inventory.find_async(iid))
+        abort(status.HTTP_404_NOT_FOUND, f"Product with id '{iid}' was not found.")
+    return json_response(
+        row_encoder.dumps(product.serialize()),
+        status.HTTP_200_OK,
+        {"ETag": quote_etag(item_etag(product))},
+    )
+
+
+@needs_database
+async def delete_item(request: Request):
+    """Deletes a product; deleting a missing product also returns 204"""
+    iid = request.path_params["iid"]
+    logger.info("Request to delete product with id: %s", iid)
+    if stored_id(iid) is not None:
+        await Inventory.delete_async(iid)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@needs_database
+async def restock_item(request: Request):
+    """Restocks a product by its restock count or up to its restock level"""
+    iid = item_key(request.path_params["iid"])
+    logger.info("Request to restock product with id %s...", iid)
+    versions = conditional.if_match_versions(request.headers.get("if-match"))
+    product = await Inventory.restock_async(iid, versions)
+    if product is None:
+        if versions is not None:
+            precondition_failed(iid, await Inventory.find_async(iid))
+        abort(status.HTTP_404_NOT_FOUND, f"Product {iid} does not exist")
+    return json_response(
+        row_encoder.dumps(product.serialize()),
+        status.HTTP_200_OK,
+        {"ETag": quote_etag(item_etag(product))},
+    )
+
+
+######################################################################
+#  PATH: /api/inventory
+######################################################################
+@needs_database
+async def list_items(request: Request):
+    """Returns one page of the products matching the filters, in id order"""
+    logger.info("Request to list all products")
+    filters = {key: request.query_params.getlist(key)[0] for key in request.query_params}
+    limit = page_limit(filters.pop("limit", None))
+    position = decode_cursor(filters.pop("cursor", None), "id")
+    after = position["id"] if position else None
+    fields = parse_fields(filters.pop("fields", None))
+    # one extra row tells us whether there is a next page
+    fingerprint = await Inventory.fingerprint_async(limit + 1, after=after, **filters)
+    etag = content_etag([f"{request.url.path}?{request.url.query}", *map(str, fingerprint)])
+    if parse_etags(request.headers.get("if-none-match")).contains_weak(etag):
+        return not_modified(etag)
+    products = await Inventory.find_page_async(limit + 1, after=after, fields=fields, **filters)
+    headers = {"ETag": quote_etag(etag)}
+    if len(products) > limit:
+        products = products[:limit]
+        params = dict(filters, fields=",".join(fields)) if fields else filters
+        query = urlencode({"limit": limit, "cursor": encode_cursor(id=products[-1].id), **params})
+        headers["Link"] = f'<{request.url_for("inventory_collection")}?{query}>; rel="next"'
+    return json_response(row_encoder.encode_rows(products), status.HTTP_200_OK, headers)
+
+
+@needs_database
+async def create_item(request: Request):
+    """Creates a product, or returns 409 when its id is taken"""
+    logger.info("Request to create a product...")
+    product = Inventory().deserialize(await json_body(request))
+    created = await product.insert_new_async()
+    if created is None:
+        abort(status.HTTP_409_CONFLICT, f"Product {product.id} already exists")
+    return json_response(
+        row_encoder.dumps(created.serialize()),
+        status.HTTP_201_CREATED,
+        {"Location": str(request.url_for("inventory_resource", iid=created.id))},
+    )
+
+
+######################################################################
+#  U T I L I T Y   F U N C T I O N S
+######################################################################
+async def json_body(request):
+    """Returns the JSON body of a request, which must be application/json"""
+    if request.headers.get("content-type") != "application/json":
+        abort(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, "Content-Type must be application/json")
+    try:
+        return json.loads(await request.body())
+    except ValueError:
+        abort(status.HTTP_400_BAD_REQUEST, "The body is not valid JSON")
+    return None
+
+
+async def http_error(_request, error):
+    """Returns the errors raised by abort() in the same shape as the Flask app"""
+    return JSONResponse({"message": error.description}, status_code=error.code)
+
+
+async def request_validation_error(_request, error):
+    """Handles Value Errors from bad data"""
+    message = str(error)
+    logger.error(message)
+    return JSONResponse(
+        {"status_code": status.HTTP_400_BAD_REQUEST, "error": "Bad Request", "message": message},
+        status_code=status.HTTP_400_BAD_REQUEST,
+    )
+
+
+async def database_connection_error(_request, error):
+    """Handles Database Errors from connection attempts"""
+    message = str(error)
+    logger.critical(message)
+    return JSONResponse(
+        {"status_code": status.HTTP_503_SERVICE_UNAVAILABLE, "error": "Service Unavailable", "message": message},
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_app):
+    """Opens the async engine when the server starts and closes it at shutdown"""
+    engine = Inventory.init_async_db(
+        flask_app.config["SQLALCHEMY_DATABASE_URI"], **flask_app.config["ASYNC_ENGINE_OPTIONS"]
+    )
+    yield
+    await engine.dispose()
+
+
+app = Starlette(
+    routes=[
+        Route("/api/inventory/{iid:int}", get_item, methods=["GET"], name="inventory_resource"),
+        Route("/api/inventory/{iid:int}", put_item, methods=["PUT"]),
+        Route("/api/inventory/{iid:int}", delete_item, methods=["DELETE"]),
+        Route("/api/inventory/{iid:int}/restock", restock_item, methods=["PUT"]),
+        Route("/api/inventory", list_items, methods=["GET"], name="inventory_collection"),
+        Route("/api/inventory", create_item, methods=["POST"]),
+        # everything else, e.g. /api/inventory/stats, /metrics and /apidocs
+        Mount("/", app=WSGIMiddleware(flask_app)),
+    ],
+    exception_handlers={
+        HTTPException: http_error,
+        DataValidationError: request_validation_error,
+        DatabaseConnectionError: database_connection_error,
+    },
+    lifespan=lifespan,
+)
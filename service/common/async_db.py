@@ -0,0 +1,128 @@
+"""
+Async Inventory Access
+
+Async counterparts of the data access methods of the Inventory model, run
+on an async engine by the ASGI app in service/asgi.py. InventoryAsync is a
+mixin of service.models.Inventory and reuses its statements, so the SQL is
+the same as that of the sync methods.
+"""
+import logging
+from sqlalchemy.ext.asyncio import create_async_engine
+from service.common.cache import item_cache
+from service.common.database import db
+
+logger = logging.getLogger("flask.app")
+
+# Drivers of the async engine, by the dialect named in the database URI
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+class InventoryAsync:
+    """Async data access methods of the Inventory model"""
+
+    # engine of the async methods, set up by init_async_db()
+    async_engine = None
+
+    @classmethod
+    def init_async_db(cls, database_uri, **options):
+        """Creates the async engine for a database URI of a sync driver
+
+        Args:
+            database_uri (string): e.g. DATABASE_URI, whose dialect picks the
+                driver from ASYNC_DRIVERS
+            options: keyword arguments of create_async_engine()
+        """
+        logger.info("Initializing async database")
+        cls.async_engine = create_async_engine(async_database_uri(database_uri), **options)
+        return cls.async_engine
+
+    @classmethod
+    async def execute_async(cls, statement, params=None) -> list:
+        """Runs a statement in a transaction of its own and returns its rows"""
+        async with cls.async_engine.begin() as connection:
+            result = await connection.execute(statement, params or {})
+            return result.all() if result.returns_rows else []
+
+    @classmethod
+    async def find_async(cls, by_id):
+        """Finds a Product by its ID, or returns None"""
+        logger.info("Processing lookup for id %s ...", by_id)
+        rows = await cls.execute_async(db.select(cls).where(cls.id == by_id))
+        return cls(**rows[0]._asdict()) if rows else None
+
+    @classmethod
+    async def find_fields_async(cls, by_id, fields=None):
+        """Like find_fields(), returns the row of some of a Product's columns"""
+        logger.info("Processing lookup of %s for id %s ...", fields, by_id)
+        rows = await cls.execute_async(cls.fields_statement(by_id, fields))
+        return rows[0] if rows else None
+
+    @classmethod
+    async def find_by_queries_async(cls, **kwargs) -> list:
+        """Returns all Products matching the query string parameters"""
+        statement, params = cls.find_query(**kwargs)
+        return [cls(**row._asdict()) for row in await cls.execute_async(statement, params)]
+
+    @classmethod
+    async def find_page_async(cls, limit, after=None, fields=None, **kwargs) -> list:
+        """Like find_page(), returns one page of rows of the API columns"""
+        return await cls.execute_async(*cls.page_query(limit, after, fields, **kwargs))
+
+    @classmethod
+    async def fingerprint_async(cls, limit, after=None, **kwargs) -> tuple:
+        """Like fingerprint(), returns (row count, latest updated_at, sums of ids and versions) of a page"""
+        rows = await cls.execute_async(*cls.fingerprint_query(limit, after, **kwargs))
+        return tuple(rows[0])
+
+    async def insert_new_async(self):
+        """Creates this Product unless its id is taken, see insert_new()"""
+        logger.info("Inserting %s", self.id)
+        self.check_new_id()
+        rows = await self.execute_async(self.insert_new_statement(self.async_engine))
+        if not rows:
+            return None
+        item_cache.invalidate(rows[0].id)
+        return type(self)(**rows[0]._asdict())
+
+    async def replace_async(self, versions=None):
+        """Overwrites the stored Product with this id, see replace()"""
+        logger.info("Replacing %s", self.id)
+        rows = await self.execute_async(self.replace_statement(versions))
+        item_cache.invalidate(int(self.id))
+        return type(self)(**rows[0]._asdict()) if rows else None
+
+    async def upsert_async(self):
+        """Creates or overwrites the Product with this id, see upsert()"""
+        logger.info("Upserting %s", self.id)
+        rows = await self.execute_async(self.upsert_statement(self.async_engine))
+        item_cache.invalidate(int(self.id))
+        return type(self)(**rows[0]._asdict())
+
+    @classmethod
+    async def delete_async(cls, by_id):
+        """Removes the Product with this id, if there is one, with a single DELETE"""
+        logger.info("Deleting %s", by_id)
+        await cls.execute_async(db.delete(cls.__table__).where(cls.id == by_id))
+        item_cache.invalidate(int(by_id))
+
+    @classmethod
+    async def restock_async(cls, by_id, versions=None):
+        """Restocks a Product in one statement, see restock()"""
+        logger.info("Processing restock for id %s ...", by_id)
+        criteria = [cls.id == by_id]
+        if versions is not None:
+            criteria.append(cls.version_criterion(versions))
+        rows = await cls.execute_async(cls.restock_statement(*criteria))
+        item_cache.invalidate(*(row.id for row in rows))
+        return cls(**rows[0]._asdict()) if rows else None
+
+
+def async_database_uri(database_uri) -> str:
+    """Returns a database URI with the driver of its dialect from ASYNC_DRIVERS"""
+    scheme, separator, rest = database_uri.partition("://")
+    dialect = scheme.split("+", 1)[0]
+    if dialect == "postgres":
+        dialect = "postgresql"
+    if not separator or dialect not in ASYNC_DRIVERS:
+        raise NotImplementedError(f"There is no async driver for {scheme}")
+    return f"{ASYNC_DRIVERS[dialect]}://{rest}"
@@ -0,0 +1,175 @@
+"""
+Caches
+
+This module contains a small in-process LRU cache with a time to live,
+used to serve single inventory items without a database round trip, and
+a cache of the SQL statements built for each shape of query
+"""
+import threading
+import time
+from collections import OrderedDict
+from service import config
+
+
+class ItemCache:
+    """A thread safe LRU cache whose entries expire after ttl seconds
+
+    Each gunicorn worker has its own cache, so after a write another worker
+    may serve its old copy until the entry expires; ttl bounds that window.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # called with "hit", "miss", "eviction" or "invalidation" as they happen
+        self.on_event = None
+
+    def generation(self) -> int:
+        """Returns a token to pass to put() once the value has been loaded"""
+        return self._generation
+
+    def get(self, key):
+        """Returns the cached value for key, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self._emit("hit")
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+                self.evictions += 1
+                self._emit("eviction")
+            self.misses += 1
+            self._emit("miss")
+            return None
+
+    def put(self, key, value, generation=None):
+        """Stores value under key, evicting the least recently used entry if full
+
+        Args:
+            generation (int): the token from generation() taken before the value
+                was read; the value is dropped if anything was invalidated since
+        """
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+                self._emit("eviction")
+
+    def invalidate(self, *keys):
+        """Removes keys from the cache"""
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self.invalidations += 1
+                    self._emit("invalidation")
+
+    def _emit(self, event):
+        if self.on_event is not None:
+            self.on_event(event)
+
+    def clear(self):
+        """Removes every entry from the cache"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Returns the size and the hit, miss and eviction counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+class StatementCache:
+    """A thread safe LRU cache of SQL statements keyed by the shape of a query
+
+    Statements hold bound parameters instead of values, so one statement
+    serves every request with the same filter keys, and SQLAlchemy finds
+    its compiled form in the engine's compiled cache.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # called with "hit", "miss" or "eviction" as they happen
+        self.on_event = None
+
+    def get_or_build(self, key, build):
+        """Returns the statement cached under key, calling build() on a miss"""
+        with self._lock:
+            statement = self._entries.get(key)
+            if statement is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self._emit("hit")
+                return statement
+            self.misses += 1
+            self._emit("miss")
+        statement = build()
+        if self.maxsize > 0:
+            with self._lock:
+                self._entries[key] = statement
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+                    self._emit("eviction")
+        return statement
+
+    def _emit(self, event):
+        if self.on_event is not None:
+            self.on_event(event)
+
+    def clear(self):
+        """Removes every statement from the cache"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Returns the size and the hit, miss and eviction counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+# Serialized inventory items keyed by their integer id
+item_cache = ItemCache(config.ITEM_CACHE_SIZE, config.ITEM_CACHE_TTL)
+
+# Statements of the query builder keyed by (purpose, filter keys)
+statement_cache = StatementCache(config.STATEMENT_CACHE_SIZE)
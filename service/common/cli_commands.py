@@ -1,8 +1,15 @@
 """
 Flask CLI Command Extensions
 """
+import csv
+import time
+from itertools import islice
 from service import app
-from service.models import db
+import click
+from service.models import db, Inventory, DataValidationError, DatabaseConnectionError
+from service.stats import InventoryStats
+from service.common.export import FORMATS, export_inventory
+from service.common.importer import from_feed, import_batches
 
 
 ######################################################################
@@ -19,3 +26,159 @@ def db_create():
     db.drop_all()
     db.create_all()
     db.session.commit()
+
+
+######################################################################
+# Command to create the schema before the service starts
+# Usage:
+#   flask db-init
+######################################################################
+@app.cli.command("db-init")
+def db_init():
+    """
+    Creates the tables, indexes and triggers that do not exist yet. Run it
+    once per deployment, before the workers start; it waits for the database
+    like the first request of a worker does.
+    """
+    try:
+        Inventory.wait_for_db(
+            app.config["RETRY_COUNT"], app.config["RETRY_DELAY"], app.config["RETRY_MAX_DELAY"]
+        )
+    except DatabaseConnectionError as error:
+        raise click.ClickException(str(error)) from error
+    Inventory.create_schema()
+    click.echo("Database schema is up to date")
+
+
+######################################################################
+# Command to load a supplier feed into the inventory
+# Usage:
+#   flask inventory-import feed.csv [--rejects rejects.csv]
+######################################################################
+@app.cli.command("inventory-import")
+@click.argument("feed", type=click.Path(exists=True, dir_okay=False))
+@click.option("--rejects", type=click.Path(dir_okay=False), help="Where to write invalid rows [FEED.rejects.csv].")
+@click.option("--batch-size", default=10000, show_default=True, help="Rows sent to the database at a time.")
+def inventory_import(feed, rejects, batch_size):
+    """
+    Inserts or updates the products of a CSV feed whose header names the
+    inventory fields. Rows that fail validation are written with their line
+    number and error to the rejects file, and the rest are imported in one
+    transaction.
+    """
+    rejects = rejects or f"{feed}.rejects.csv"
+    started = time.perf_counter()
+    with open(feed, newline="", encoding="utf-8") as source:
+        reader = csv.DictReader(source)
+        log = RejectLog(rejects, ["line", "error"] + (reader.fieldnames or []))
+        with log:
+            valid = validated_rows(reader, log)
+            imported = import_batches(iter(lambda: list(islice(valid, batch_size)), []))
+    elapsed = time.perf_counter() - started
+    rate = (imported + log.count) / elapsed if elapsed else 0.0
+    click.echo(f"Imported {imported} products in {elapsed:.1f}s ({rate:,.0f} rows/sec)")
+    if log.count:
+        click.echo(f"Rejected {log.count} rows, see {rejects}")
+
+
+######################################################################
+# Command to export the inventory to compressed shards
+# Usage:
+#   flask inventory-export backup/ [--format csv] [--workers 8]
+######################################################################
+@app.cli.command("inventory-export")
+@click.argument("directory", type=click.Path(file_okay=False))
+@click.option("--format", "fmt", type=click.Choice(FORMATS), default="jsonl", show_default=True)
+@click.option("--workers", type=int, help="Worker processes on PostgreSQL [number of CPUs].")
+@click.option("--shard-size", default=100000, show_default=True, help="Most products per shard.")
+def inventory_export(directory, fmt, workers, shard_size):
+    """
+    Writes the inventory to gzip compressed shards and a manifest.json in
+    DIRECTORY, all from one consistent snapshot of the table. On PostgreSQL
+    the shards are read in parallel worker processes.
+    """
+    started = time.perf_counter()
+    manifest = export_inventory(directory, fmt, workers, shard_size)
+    elapsed = time.perf_counter() - started
+    rate = manifest["rows"] / elapsed if elapsed else 0.0
+    click.echo(
+        f"Exported {manifest['rows']} products to {len(manifest['shards'])} shards"
+        f" in {elapsed:.1f}s ({rate:,.0f} rows/sec)"
+    )
+
+
+def validated_rows(reader, log):
+    """Yields the feed rows that pass validation, sending the others to log"""
+    for record in reader:
+        try:
+            row = from_feed(record)
+        except DataValidationError as error:
+            log.write(reader.line_num, error, record)
+            continue
+        row["line"] = reader.line_num
+        yield row
+
+
+class RejectLog:
+    """Writes rejected feed rows to a CSV file, created on the first reject"""
+
+    def __init__(self, path, fieldnames):
+        self.path = path
+        self.fieldnames = fieldnames
+        self.count = 0
+        self._file = None
+        self._writer = None
+
+    def write(self, line, error, record):
+        """Records one rejected row"""
+        if self._writer is None:
+            self._file = open(self.path, "w", newline="", encoding="utf-8")  # pylint: disable=consider-using-with
+            self._writer = csv.DictWriter(self._file, self.fieldnames, extrasaction="ignore")
+            self._writer.writeheader()
+        self._writer.writerow(dict(record, line=line, error=str(error)))
+        self.count += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._file is not None:
+            self._file.close()
+
+
+######################################################################
+# Command to build missing indexes on a live database
+# Usage:
+#   flask db-indexes
+######################################################################
+@app.cli.command("db-indexes")
+def db_indexes():
+    """
+    Creates the secondary indexes of the inventory table if they are missing.
+    On PostgreSQL they are built concurrently, so the service can keep running.
+    """
+    for name in Inventory.create_indexes():
+        click.echo(f"Index {name} is in place")
+
+
+######################################################################
+# Command to rebuild and check the inventory statistics counters
+# Usage:
+#   flask db-stats [--check]
+######################################################################
+@app.cli.command("db-stats")
+@click.option("--check", is_flag=True, help="Only compare the counters with a fresh count.")
+def db_stats(check):
+    """
+    Rebuilds the inventory statistics counters from the inventory table and
+    verifies them. On PostgreSQL writes to the inventory wait while it runs.
+    """
+    with db.engine.begin() as connection:
+        if not check:
+            InventoryStats.rebuild(connection)
+        drift = InventoryStats.verify(connection)
+    for condition, slot in drift:
+        click.echo(f"Counters of {condition.name} slot {slot} do not match the inventory")
+    if drift:
+        raise click.ClickException("Inventory statistics are out of date, run flask db-stats to rebuild them")
+    click.echo("Inventory statistics are correct")
@@ -0,0 +1,77 @@
+"""
+Conditional Requests
+
+This module contains the ETag, If-Match and response helpers shared by the
+Flask routes and the ASGI app. The response helpers take the response class
+of the framework, since Flask and Starlette responses are built from the
+same (body, status, headers, media type) arguments.
+"""
+import hashlib
+import json
+from datetime import datetime
+from flask import abort
+from werkzeug.http import parse_etags, quote_etag
+from service.common import status
+
+# Format of the update time in item_etag()
+ETAG_TIME_FORMAT = "%Y%m%d%H%M%S%f"
+
+
+def content_etag(content):
+    """Returns a strong ETag value hashed from JSON serializable content"""
+    payload = json.dumps(content, sort_keys=True).encode("utf-8")
+    return hashlib.sha1(payload).hexdigest()
+
+
+def item_etag(product):
+    """Returns the ETag value of a product, made from its version
+
+    The update time is included so a deleted and recreated product does not
+    reuse the ETag of the old one.
+    """
+    return f"{product.version}-{product.updated_at:{ETAG_TIME_FORMAT}}"
+
+
+def if_match_versions(header):
+    """Returns the (version, updated_at) pairs named by an If-Match header
+
+    Returns None when any version may be written. An ETag that item_etag()
+    did not make names no version, so a write conditional on it never matches.
+    """
+    etags = parse_etags(header)
+    if not etags or etags.star_tag:
+        return None
+    versions = []
+    for etag in etags.as_set():
+        version, _, updated_at = etag.partition("-")
+        if not version.isdigit():
+            continue
+        try:
+            versions.append((int(version), datetime.strptime(updated_at, ETAG_TIME_FORMAT)))
+        except ValueError:
+            continue
+    return versions
+
+
+def precondition_failed(key, stored):
+    """Aborts with 412 when a conditional write missed a product that exists
+
+    Args:
+        key (int): the id of the product
+        stored: the product as it is now, or None when it does not exist
+    """
+    if stored is not None:
+        abort(
+            status.HTTP_412_PRECONDITION_FAILED,
+            f"Product {key} has changed since the version in If-Match",
+        )
+
+
+def json_response(response_class, body, code, headers=None):
+    """Returns a response for a body that is already encoded as JSON"""
+    return response_class(body, code, headers, "application/json")
+
+
+def not_modified(response_class, etag):
+    """Returns an empty 304 Not Modified response for etag"""
+    return response_class(None, status.HTTP_304_NOT_MODIFIED, {"ETag": quote_etag(etag)})
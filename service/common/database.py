@@ -0,0 +1,25 @@
+"""
+Database
+
+The SQLAlchemy object and the exceptions of the data layer. They live apart
+from service.models so the modules the Inventory model is assembled from
+can use them; service.models exports them as before.
+"""
+from datetime import datetime, timezone
+from flask_sqlalchemy import SQLAlchemy
+
+# Create the SQLAlchemy object to be initialized later in init_db()
+db = SQLAlchemy()
+
+
+def utcnow():
+    """Returns the current UTC time as a naive datetime"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class DataValidationError(Exception):
+    """Used for an data validation errors when deserializing"""
+
+
+class DatabaseConnectionError(Exception):
+    """Custom Exception when database connection fails"""
@@ -0,0 +1,86 @@
+"""
+Row Encoder
+
+This module turns database rows straight into JSON bytes in a single
+pass, using orjson when it is installed and the standard library otherwise
+"""
+import json
+from datetime import date
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def _enum_name(value):
+    return None if value is None else value.name
+
+
+def _isoformat(value):
+    return None if value is None else value.isoformat()
+
+
+class RowEncoder:
+    """Encodes rows with named fields to JSON
+
+    The conversions each field needs are worked out once per set of field
+    names and reused for every row after that.
+    """
+
+    def __init__(self, enum_fields=(), date_fields=(), use_orjson=True):
+        self.use_orjson = use_orjson and orjson is not None
+        self._converters = {name: _enum_name for name in enum_fields}
+        if not self.use_orjson:
+            # orjson writes dates as ISO 8601 by itself
+            self._converters.update({name: _isoformat for name in date_fields})
+        self._plans = {}
+
+    def _plan(self, fields):
+        """Returns the (index, converter) pairs for rows with these fields"""
+        plan = self._plans.get(fields)
+        if plan is None:
+            plan = [
+                (index, self._converters[name])
+                for index, name in enumerate(fields)
+                if name in self._converters
+            ]
+            self._plans[fields] = plan
+        return plan
+
+    def to_dicts(self, rows) -> list:
+        """Converts rows to JSON ready dictionaries"""
+        if not rows:
+            return []
+        fields = tuple(rows[0]._fields)
+        plan = self._plan(fields)
+        if not plan:
+            return [dict(zip(fields, row)) for row in rows]
+        results = []
+        for row in rows:
+            values = list(row)
+            for index, convert in plan:
+                values[index] = convert(values[index])
+            results.append(dict(zip(fields, values)))
+        return results
+
+    def encode_rows(self, rows) -> bytes:
+        """Encodes a list of rows as a JSON array"""
+        return self.dumps(self.to_dicts(rows))
+
+    def encode_row(self, row) -> bytes:
+        """Encodes a single row as a JSON object"""
+        return self.dumps(self.to_dicts([row])[0])
+
+    def dumps(self, data) -> bytes:
+        """Encodes already converted data"""
+        if self.use_orjson:
+            return orjson.dumps(data)
+        return json.dumps(data, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def _default(value):
+    """Lets the standard library encoder write dates"""
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -18,7 +18,7 @@
 Module: error_handlers
 """
 from service import api
-from service.models import DataValidationError
+from service.models import DataValidationError, DatabaseConnectionError
 from service import app
 from . import status
 
@@ -129,13 +129,15 @@ def request_validation_error(error):
     }, status.HTTP_400_BAD_REQUEST
 
 
-# @api.errorhandler(DatabaseConnectionError)
-# def database_connection_error(error):
-#     """Handles Database Errors from connection attempts"""
-#     message = str(error)
-#     app.logger.critical(message)
-#     return {
-#         "status_code": status.HTTP_503_SERVICE_UNAVAILABLE,
-#         "error": "Service Unavailable",
-#         "message": message,
-#     }, status.HTTP_503_SERVICE_UNAVAILABLE
+# registered on the app too, for /health and the other routes outside the api
+@app.errorhandler(DatabaseConnectionError)
+@api.errorhandler(DatabaseConnectionError)
+def database_connection_error(error):
+    """Handles Database Errors from connection attempts"""
+    message = str(error)
+    app.logger.critical(message)
+    return {
+        "status_code": status.HTTP_503_SERVICE_UNAVAILABLE,
+        "error": "Service Unavailable",
+        "message": message,
+    }, status.HTTP_503_SERVICE_UNAVAILABLE
@@ -0,0 +1,154 @@
+"""
+Inventory Export
+
+This module writes the inventory table to gzip compressed JSONL or CSV
+shards plus a manifest, all read from one consistent snapshot. On
+PostgreSQL the id ranges are read in parallel by worker processes that
+share the snapshot exported by a leader transaction; other databases are
+read in a single pass by one statement.
+"""
+import csv
+import gzip
+import io
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from itertools import islice
+from service.common.queries import API_FIELDS
+from service.models import Inventory, db, row_encoder
+
+logger = logging.getLogger("flask.app")
+
+FORMATS = ("jsonl", "csv")
+
+# Rows fetched from the database per round trip
+FETCH_SIZE = 5000
+
+
+def export_inventory(directory, fmt="jsonl", workers=None, shard_size=100000) -> dict:
+    """Exports the inventory into directory and returns the manifest
+
+    Args:
+        directory (str): where the shards and manifest.json are written
+        fmt (str): one of FORMATS
+        workers (int): the most worker processes to use on PostgreSQL
+        shard_size (int): the most Products per shard
+    """
+    os.makedirs(directory, exist_ok=True)
+    started = datetime.now(timezone.utc)
+    if db.engine.dialect.name == "postgresql":
+        snapshot, shards = export_parallel(directory, fmt, workers or os.cpu_count(), shard_size)
+    else:
+        snapshot, shards = None, export_sequential(directory, fmt, shard_size)
+    manifest = {
+        "table": Inventory.__tablename__,
+        "format": fmt,
+        "compression": "gzip",
+        "fields": list(API_FIELDS),
+        "snapshot": snapshot,
+        "started_at": started.isoformat(),
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+        "rows": sum(shard["rows"] for shard in shards),
+        "shards": shards,
+    }
+    with open(os.path.join(directory, "manifest.json"), "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+    logger.info("Exported %d products in %d shards", manifest["rows"], len(shards))
+    return manifest
+
+
+def export_parallel(directory, fmt, workers, shard_size) -> tuple:
+    """Exports id ranges in worker processes under one exported snapshot
+
+    The leader transaction stays open, without reading any rows, until every
+    worker is done, which keeps the snapshot valid.
+    """
+    engine = db.engine
+    with engine.connect().execution_options(isolation_level="REPEATABLE READ") as leader:
+        snapshot = leader.exec_driver_sql("SELECT pg_export_snapshot()").scalar()
+        boundaries = Inventory.id_boundaries(leader, shard_size)
+        jobs = [
+            {
+                "path": shard_path(directory, number, fmt),
+                "fmt": fmt,
+                "snapshot": snapshot,
+                "first_id": first_id,
+                "end_id": boundaries[number] if number < len(boundaries) else None,
+            }
+            for number, first_id in enumerate(boundaries, start=1)
+        ]
+        logger.info("Exporting %d shards with snapshot %s", len(jobs), snapshot)
+        # forked workers start with the app context of this process
+        with ProcessPoolExecutor(
+            max_workers=max(1, min(workers, len(jobs))),
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=engine.dispose,
+            initargs=(False,),
+        ) as pool:
+            shards = list(pool.map(export_range, jobs))
+        leader.rollback()
+    return snapshot, shards
+
+
+def export_range(job) -> dict:
+    """Writes one id range to a shard, reading with the leader's snapshot"""
+    with db.engine.connect().execution_options(isolation_level="REPEATABLE READ") as connection:
+        connection.exec_driver_sql("SET TRANSACTION SNAPSHOT %s", (job["snapshot"],))
+        rows = connection.execution_options(stream_results=True, yield_per=FETCH_SIZE).execute(
+            Inventory.range_statement(job["first_id"], job["end_id"])
+        )
+        shard = write_shard(job["path"], job["fmt"], rows)
+        connection.rollback()
+    return shard
+
+
+def export_sequential(directory, fmt, shard_size) -> list:
+    """Exports every shard from a single streamed SELECT, so one snapshot"""
+    shards = []
+    with db.engine.connect() as connection:
+        rows = connection.execution_options(stream_results=True, yield_per=FETCH_SIZE).execute(
+            Inventory.range_statement()
+        )
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, shard_size))
+            if not chunk:
+                break
+            shards.append(write_shard(shard_path(directory, len(shards) + 1, fmt), fmt, chunk))
+    return shards
+
+
+def shard_path(directory, number, fmt) -> str:
+    """Returns the file name of a shard"""
+    return os.path.join(directory, f"inventory-{number:05d}.{fmt}.gz")
+
+
+def write_shard(path, fmt, rows) -> dict:
+    """Writes rows of the API columns to a gzip file and returns its manifest entry"""
+    count, first_id, last_id = 0, None, None
+    with gzip.open(path, "wb", compresslevel=6) as file:
+        if fmt == "csv":
+            text = io.TextIOWrapper(file, encoding="utf-8", newline="")
+            writer = csv.writer(text)
+            writer.writerow(API_FIELDS)
+        for row in rows:
+            if fmt == "csv":
+                writer.writerow(row_encoder.to_dicts([row])[0].values())
+            else:
+                file.write(row_encoder.encode_row(row) + b"\n")
+            count += 1
+            first_id = row.id if first_id is None else first_id
+            last_id = row.id
+        if fmt == "csv":
+            text.flush()
+            text.detach()
+    return {
+        "file": os.path.basename(path),
+        "rows": count,
+        "bytes": os.path.getsize(path),
+        "first_id": first_id,
+        "last_id": last_id,
+    }
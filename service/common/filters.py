@@ -0,0 +1,102 @@
+"""
+Query String Filters
+
+The filter grammar of the list endpoints: keys are an API field, optionally
+followed by __ and one of the FILTER_OPERATORS, e.g. quantity__lt=5,
+condition__in=NEW,USED or name__prefix=comp. These helpers parse the keys,
+convert the values to the types of the columns and build the SQL criteria.
+"""
+from datetime import date
+from enum import Enum
+from functools import lru_cache
+from service.common.database import db, DataValidationError
+
+# Escape character of the LIKE patterns made by like_prefix()
+LIKE_ESCAPE = "/"
+
+# Operators of the query string filter grammar, used as field__operator=value.
+# Each one compares a column with a bound parameter or value
+FILTER_OPERATORS = {
+    "eq": lambda column, param: column == param,
+    "ne": lambda column, param: column != param,
+    "lt": lambda column, param: column < param,
+    "lte": lambda column, param: column <= param,
+    "gt": lambda column, param: column > param,
+    "gte": lambda column, param: column >= param,
+    "in": lambda column, param: column.in_(param),
+    "prefix": lambda column, param: column.like(param, escape=LIKE_ESCAPE),
+}
+
+
+def parse_filter_key(key, fields) -> tuple:
+    """Splits a query string key into its field and operator names
+
+    Args:
+        key (string): a key of the query string
+        fields (tuple): the field names that can be filtered on
+
+    Raises:
+        DataValidationError: for an unknown field or operator
+    """
+    name, _, operator = key.partition("__")
+    if name not in fields:
+        raise DataValidationError(f"Unknown filter: {key}")
+    if (operator or "eq") not in FILTER_OPERATORS:
+        raise DataValidationError(f"Unknown filter operator: {key}")
+    return name, operator or "eq"
+
+
+def filter_criteria(model, fields, shape, values=None) -> list:
+    """Returns the SQL filter expressions on a model for a tuple of query string keys
+
+    Every value is a bound parameter named after its key, and IN lists use
+    an expanding parameter, so the expressions hold no values at all. When
+    values are given they are used in place of the named parameters.
+    """
+    criteria = []
+    for key in shape:
+        name, operator = parse_filter_key(key, fields)
+        if values is not None:
+            param = values[key]
+        else:
+            param = db.bindparam(key, expanding=operator == "in")
+        criteria.append(FILTER_OPERATORS[operator](getattr(model, name), param))
+    return criteria
+
+
+def like_prefix(value) -> str:
+    """Returns a LIKE pattern matching strings that start with value"""
+    for char in (LIKE_ESCAPE, "%", "_"):
+        value = value.replace(char, LIKE_ESCAPE + char)
+    return value + "%"
+
+
+def filter_value(column, value):
+    """Converts a query string value to the Python type of a column
+
+    Args:
+        column: the column being filtered on
+        value (string): the value from the query string
+    """
+    python_type = column.type.python_type
+    try:
+        if issubclass(python_type, Enum):
+            return enum_member(python_type, value)
+        if python_type is date:
+            return date.fromisoformat(value)
+        return python_type(value)
+    except (ValueError, KeyError) as error:
+        raise DataValidationError(f"Invalid value for {column.key}: {value!r}") from error
+
+
+@lru_cache(maxsize=64)
+def enum_member(enum_class, value):
+    """Converts a query string value to a member of an Enum
+
+    Args:
+        enum_class (Enum): the enumeration, e.g. Condition
+        value (string): the name of the member in any case, or its number
+    """
+    if value.isdigit():
+        return enum_class(int(value))
+    return enum_class[value.upper()]
@@ -0,0 +1,116 @@
+"""
+Inventory Import
+
+This module merges a supplier feed into the inventory table in a single
+transaction. The rows are validated with the rules of Inventory.deserialize(),
+loaded into a temporary staging table, with COPY on PostgreSQL and
+executemany elsewhere, and then upserted with one INSERT ... SELECT.
+"""
+import csv
+import io
+import logging
+from sqlalchemy import MetaData, Table
+from service.common.cache import item_cache
+from service.common.queries import API_FIELDS
+from service.common.statements import dialect_insert, upsert_values
+from service.models import db, Inventory, DataValidationError
+
+logger = logging.getLogger("flask.app")
+
+# Staging table of import_batches(), created per import and never by create_all()
+inventory_staging = Table(
+    "inventory_staging",
+    MetaData(),
+    db.Column("line", db.Integer, nullable=False),
+    db.Column("id", db.Integer, nullable=False),
+    db.Column("name", db.String(63)),
+    db.Column("quantity", db.Integer, nullable=False),
+    db.Column("restock_level", db.Integer, nullable=False),
+    db.Column("restock_count", db.Integer, nullable=False),
+    db.Column("condition", db.String(16), nullable=False),
+    db.Column("first_entry_date", db.Date(), nullable=False),
+    db.Column("last_restock_date", db.Date(), nullable=False),
+    prefixes=["TEMPORARY"],
+)
+
+
+def from_feed(record) -> dict:
+    """
+    Validates a record of a CSV feed with the rules of deserialize()
+
+    Args:
+        record (dict): the strings of one CSV line, keyed by column name
+
+    Returns:
+        dict: the column values of the Product, keyed by API field
+    """
+    data = dict(record)
+    try:
+        for key in ("id", "quantity", "restock_level", "restock_count"):
+            data[key] = int(data[key])
+    except KeyError as error:
+        raise DataValidationError("Invalid Product: missing " + error.args[0]) from error
+    except (TypeError, ValueError) as error:
+        raise DataValidationError("Invalid Product: bad number - " + str(error)) from error
+    data["name"] = data.get("name") or None  # CSV cannot tell an empty name from none
+    product = Inventory().deserialize(data)
+    return {name: getattr(product, name) for name in API_FIELDS}
+
+
+def import_batches(batches) -> int:
+    """
+    Inserts or updates Products from a feed in a single transaction
+
+    When an id appears more than once the last row wins.
+
+    Args:
+        batches: lists of dicts from from_feed(), each with its "line" number
+
+    Returns:
+        int: the number of Products inserted or updated
+    """
+    table = Inventory.__table__
+    staging = inventory_staging
+    with db.engine.begin() as connection:
+        staging.create(connection, checkfirst=False)
+        try:
+            for batch in batches:
+                batch = [dict(row, condition=row["condition"].name) for row in batch]
+                if connection.dialect.name == "postgresql":
+                    copy_rows(connection, staging, batch)
+                else:
+                    connection.execute(staging.insert(), batch)
+            latest = db.select(db.func.max(staging.c.line)).group_by(staging.c.id)
+            rows = db.select(
+                *(
+                    db.cast(staging.c[name], table.c[name].type) if name == "condition" else staging.c[name]
+                    for name in API_FIELDS
+                )
+            ).where(staging.c.line.in_(latest))
+            insert = dialect_insert(connection)(table).from_select(API_FIELDS, rows)
+            statement = insert.on_conflict_do_update(
+                index_elements=[table.c.id], set_=upsert_values(insert)
+            )
+            count = connection.execute(statement).rowcount
+        finally:
+            staging.drop(connection, checkfirst=False)
+    item_cache.clear()
+    logger.info("Imported %d products", count)
+    return count
+
+
+def copy_rows(connection, table, rows):
+    """Loads row dicts into a PostgreSQL table with COPY ... FROM STDIN"""
+    names = [column.name for column in table.columns]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(row[name] for name in names)
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {table.name} ({', '.join(names)}) FROM STDIN WITH (FORMAT csv)", buffer
+        )
+    finally:
+        cursor.close()
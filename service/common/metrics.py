@@ -0,0 +1,137 @@
+"""
+Metrics
+
+This module defines the Prometheus metrics of the service and hooks them
+into the request cycle, the database engine and the caches.
+
+When PROMETHEUS_MULTIPROC_DIR is set, every gunicorn worker writes its
+values to memory mapped files in that directory and /metrics adds them up
+across workers; see gunicorn.conf.py for the hook that cleans up after a
+worker exits.
+"""
+import os
+import time
+from flask import g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from service.common.cache import item_cache, statement_cache
+
+REQUESTS = Counter(
+    "inventory_http_requests_total",
+    "HTTP requests handled",
+    ["endpoint", "method", "status"],
+)
+REQUEST_LATENCY = Histogram(
+    "inventory_http_request_duration_seconds",
+    "Time to handle an HTTP request, up to the first byte of the body",
+    ["endpoint", "method", "status"],
+)
+IN_PROGRESS = Gauge(
+    "inventory_http_requests_in_progress",
+    "HTTP requests being handled",
+    multiprocess_mode="livesum",
+)
+QUERY_LATENCY = Histogram(
+    "inventory_db_query_duration_seconds",
+    "Time the database took to run a statement",
+    ["operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+CACHE_EVENTS = Counter(
+    "inventory_cache_events_total",
+    "Hits, misses, evictions and invalidations of the in-process caches",
+    ["cache", "event"],
+)
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+
+def init_metrics(app):
+    """Starts collecting metrics for the app"""
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.teardown_request(end_request)
+    item_cache.on_event = cache_counter("item")
+    statement_cache.on_event = cache_counter("statement")
+
+
+def render() -> bytes:
+    """Returns every metric in the Prometheus text format"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def cache_counter(cache):
+    """Returns an on_event hook that counts the events of a cache"""
+    counters = {}
+
+    def count(name):
+        counter = counters.get(name)
+        if counter is None:
+            counter = counters[name] = CACHE_EVENTS.labels(cache, name)
+        counter.inc()
+
+    return count
+
+
+######################################################################
+# Request hooks
+######################################################################
+def start_request():
+    """Marks the start of a request"""
+    g.metrics_started = time.perf_counter()
+    IN_PROGRESS.inc()
+
+
+def finish_request(response):
+    """Counts a request that produced a response"""
+    observe_request(response.status_code)
+    return response
+
+
+def end_request(error):
+    """Ends a request, counting it as a 500 if it failed without a response"""
+    if "metrics_started" not in g:
+        return
+    if not g.get("metrics_observed"):
+        observe_request(500 if error is not None else 200)
+    IN_PROGRESS.dec()
+
+
+def observe_request(status_code):
+    """Adds a request to the counter and latency histogram"""
+    g.metrics_observed = True
+    labels = (request.endpoint or "unmatched", request.method, str(status_code))
+    REQUESTS.labels(*labels).inc()
+    REQUEST_LATENCY.labels(*labels).observe(time.perf_counter() - g.metrics_started)
+
+
+######################################################################
+# Database hooks
+######################################################################
+@event.listens_for(Engine, "before_cursor_execute")
+def start_query(conn, cursor, statement, parameters, context, executemany):  # pylint: disable=unused-argument
+    """Marks the start of a statement"""
+    context.metrics_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def end_query(conn, cursor, statement, parameters, context, executemany):  # pylint: disable=unused-argument
+    """Adds a statement to the query latency histogram, by its first keyword"""
+    started = getattr(context, "metrics_started", None)
+    if started is not None:
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        QUERY_LATENCY.labels(operation).observe(time.perf_counter() - started)
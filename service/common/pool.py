@@ -0,0 +1,59 @@
+"""
+Connection Pool
+
+This module contains a QueuePool that also measures how long checkouts
+wait for a connection, so pool sizes can be tuned from live numbers
+"""
+import threading
+import time
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+
+class TimedQueuePool(QueuePool):
+    """A QueuePool that counts checkouts and times how long they wait
+
+    The wait includes opening a new connection when the pool has none idle.
+    Each gunicorn worker has its own pool, so the numbers are per worker.
+    """
+
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self._stats_lock:
+                self.checkouts += 1
+                self.timeouts += timed_out
+                self.wait_time += waited
+                self.max_wait = max(self.max_wait, waited)
+
+    def stats(self) -> dict:
+        """Returns the pool's occupancy and checkout wait counters"""
+        with self._stats_lock:
+            return {
+                "size": self.size(),
+                "checked_in": self.checkedin(),
+                "checked_out": self.checkedout(),
+                "overflow": self.overflow(),
+                "max_overflow": self._max_overflow,
+                "timeout": self.timeout(),
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_time_total": self.wait_time,
+                "wait_time_avg": self.wait_time / self.checkouts if self.checkouts else 0.0,
+                "wait_time_max": self.max_wait,
+            }
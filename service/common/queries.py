@@ -0,0 +1,314 @@
+"""
+Inventory Queries
+
+The read side of the Inventory model: the statements behind the list,
+export and bulk endpoints and the methods that run them. InventoryQueries
+is a mixin of service.models.Inventory, so the methods are called on that
+class, e.g. Inventory.find_page().
+"""
+import logging
+from service.common.cache import statement_cache
+from service.common.database import db, DataValidationError
+from service.common.filters import filter_criteria, filter_value, like_prefix, parse_filter_key
+
+logger = logging.getLogger("flask.app")
+
+# Largest number of ids sent in a single IN (...) clause
+IN_CLAUSE_BATCH_SIZE = 10000
+
+# Fields of a Product shown by the REST API, in output order
+API_FIELDS = (
+    "id",
+    "name",
+    "quantity",
+    "restock_level",
+    "restock_count",
+    "condition",
+    "first_entry_date",
+    "last_restock_date",
+)
+
+
+class InventoryQueries:
+    """Queries of the Inventory model that read Products"""
+
+    @classmethod
+    def find_by_queries(cls, **kwargs) -> list:
+        """Returns all Customers with the given information
+
+        Args:
+            kwargs: parameters of the query string
+        """
+        statement, params = cls.find_query(**kwargs)
+        return db.session.execute(statement, params).scalars().all()
+
+    @classmethod
+    def find_query(cls, **kwargs) -> tuple:
+        """Returns the (statement, params) of find_by_queries()"""
+        params = cls.filter_params(**kwargs)
+        statement = cls.filtered_statement(
+            "find", params, lambda criteria: db.select(cls).where(*criteria)
+        )
+        return statement, params
+
+    @classmethod
+    def find_existing_ids(cls, ids) -> set:
+        """Returns the subset of the given ids that are already in the database
+
+        Args:
+            ids (list): the Product ids to look for, checked with IN queries
+        """
+        logger.info("Processing conflict check for %d ids ...", len(ids))
+        ids = list(ids)
+        found = set()
+        for start in range(0, len(ids), IN_CLAUSE_BATCH_SIZE):
+            chunk = ids[start:start + IN_CLAUSE_BATCH_SIZE]
+            found.update(db.session.scalars(db.select(cls.id).where(cls.id.in_(chunk))))
+        return found
+
+    @classmethod
+    def id_boundaries(cls, connection, shard_size) -> list:
+        """Returns the first id of every run of shard_size Products in id order
+
+        Consecutive boundaries mark id ranges holding shard_size Products each,
+        whatever the gaps in the id space. Only the id index is read.
+
+        Args:
+            connection: the connection, and so the snapshot, to read with
+            shard_size (int): how many Products each range should hold
+        """
+        numbered = db.select(
+            cls.id, db.func.row_number().over(order_by=cls.id).label("position")
+        ).subquery()
+        statement = (
+            db.select(numbered.c.id)
+            .where((numbered.c.position - 1) % shard_size == 0)
+            .order_by(numbered.c.id)
+        )
+        return connection.execute(statement).scalars().all()
+
+    @classmethod
+    def range_statement(cls, first_id=None, end_id=None):
+        """Returns a select of the API columns with first_id <= id < end_id, in id order
+
+        Args:
+            first_id (int): the lowest id to include, or None for no lower bound
+            end_id (int): the id to stop before, or None for no upper bound
+        """
+        statement = db.select(*cls.api_columns()).order_by(cls.id)
+        if first_id is not None:
+            statement = statement.where(cls.id >= first_id)
+        if end_id is not None:
+            statement = statement.where(cls.id < end_id)
+        return statement
+
+    @classmethod
+    def api_columns(cls, fields=None) -> list:
+        """Returns the columns the REST API shows, in the order serialize() writes them
+
+        Args:
+            fields (tuple): names from API_FIELDS to narrow the columns to
+        """
+        return [getattr(cls, name) for name in fields or API_FIELDS]
+
+    @classmethod
+    def find_fields(cls, by_id, fields=None):
+        """Finds a Product by its ID, loading only some of its columns
+
+        The row holds the requested API columns followed by version and
+        updated_at, which the caller needs for the ETag.
+
+        Args:
+            by_id (int): the id of the Product to find
+            fields (tuple): names from API_FIELDS to load
+        """
+        logger.info("Processing lookup of %s for id %s ...", fields, by_id)
+        return db.session.execute(cls.fields_statement(by_id, fields)).first()
+
+    @classmethod
+    def fields_statement(cls, by_id, fields=None):
+        """Returns the select of find_fields()"""
+        return db.select(*cls.api_columns(fields), cls.version, cls.updated_at).where(
+            cls.id == by_id
+        )
+
+    @classmethod
+    def find_page(cls, limit, after=None, fields=None, **kwargs) -> list:
+        """Returns one page of the Products matching the query, in id order
+
+        The Products come back as rows of the API columns rather than as
+        Inventory objects, ready for row_encoder.
+
+        Args:
+            limit (int): the most Products to return
+            after (int): only return Products with an id greater than this
+            fields (tuple): names from API_FIELDS to select, which must include id
+            kwargs: parameters of the query string
+        """
+        statement, params = cls.page_query(limit, after, fields, **kwargs)
+        return db.session.execute(statement, params).all()
+
+    @classmethod
+    def page_query(cls, limit, after=None, fields=None, **kwargs) -> tuple:
+        """Returns the (statement, params) of find_page()"""
+        params = cls.filter_params(**kwargs)
+
+        def build(criteria):
+            statement = db.select(*cls.api_columns(fields)).where(*criteria)
+            if after is not None:
+                statement = statement.where(cls.id > db.bindparam("after"))
+            return statement.order_by(cls.id).limit(db.bindparam("limit"))
+
+        statement = cls.filtered_statement(("page", fields, after is not None), params, build)
+        return statement, dict(params, after=after, limit=limit)
+
+    @classmethod
+    def fingerprint(cls, limit, after=None, **kwargs) -> tuple:
+        """Returns (row count, latest updated_at, sum of ids, sum of versions) of one page
+
+        The page is the one find_page() returns for the same arguments. Any
+        insert, update or delete within it changes the result: every UPDATE
+        bumps a version, so the sum of versions changes even when two writes
+        get the same updated_at from the clock of the service. The database
+        computes it from the id, updated_at and version columns alone, walking
+        the same id range as the page rather than every matching Product.
+
+        Args:
+            limit (int): the most Products on the page
+            after (int): only count Products with an id greater than this
+            kwargs: parameters of the query string
+        """
+        statement, params = cls.fingerprint_query(limit, after, **kwargs)
+        return tuple(db.session.execute(statement, params).one())
+
+    @classmethod
+    def fingerprint_query(cls, limit, after=None, **kwargs) -> tuple:
+        """Returns the (statement, params) of fingerprint()"""
+        params = cls.filter_params(**kwargs)
+
+        def build(criteria):
+            page = db.select(cls.id, cls.updated_at, cls.version).where(*criteria)
+            if after is not None:
+                page = page.where(cls.id > db.bindparam("after"))
+            page = page.order_by(cls.id).limit(db.bindparam("limit")).subquery()
+            return db.select(
+                db.func.count(),
+                db.func.max(page.c.updated_at),
+                db.func.sum(page.c.id),
+                db.func.sum(page.c.version),
+            )
+
+        statement = cls.filtered_statement(("fingerprint", after is not None), params, build)
+        return statement, dict(params, after=after, limit=limit)
+
+    @classmethod
+    def find_low_stock(cls, limit, after=None, **kwargs) -> list:
+        """Returns one page of the Products below their restock level
+
+        Products are ordered by shortfall (restock_level - quantity), largest
+        first, then by id. The partial index ix_inventory_low_stock holds only
+        these Products, so the cost follows the number of low stock items.
+        Like find_page() it returns rows of the API columns.
+
+        Args:
+            limit (int): the most Products to return
+            after (tuple): (shortfall, id) of the last Product of the previous page
+            kwargs: parameters of the query string
+        """
+        params = cls.filter_params(**kwargs)
+
+        def build(criteria):
+            shortfall = cls.restock_level - cls.quantity
+            statement = db.select(*cls.api_columns()).where(
+                cls.quantity < cls.restock_level, *criteria
+            )
+            if after is not None:
+                statement = statement.where(
+                    db.tuple_(shortfall, cls.id)
+                    < db.tuple_(db.bindparam("after_shortfall"), db.bindparam("after_id"))
+                )
+            return statement.order_by(shortfall.desc(), cls.id.desc()).limit(db.bindparam("limit"))
+
+        statement = cls.filtered_statement(("low_stock", after is not None), params, build)
+        if after is not None:
+            params.update(after_shortfall=after[0], after_id=after[1])
+        return db.session.execute(statement, dict(params, limit=limit)).all()
+
+    @classmethod
+    def stream_by_queries(cls, chunk_size=1000, **kwargs):
+        """Returns an iterator over the Products matching the query, in id order
+
+        Rows of the API columns are fetched from a server-side cursor
+        chunk_size at a time, so the whole result is never held in memory.
+
+        Args:
+            chunk_size (int): how many rows to fetch per round trip
+            kwargs: parameters of the query string
+        """
+        params = cls.filter_params(**kwargs)
+        statement = cls.filtered_statement(
+            "stream",
+            params,
+            lambda criteria: db.select(*cls.api_columns()).where(*criteria).order_by(cls.id),
+        )
+        return iter(db.session.execute(statement.execution_options(yield_per=chunk_size), params))
+
+    @classmethod
+    def query_criteria(cls, **kwargs) -> list:
+        """Converts query string parameters into a list of SQL filter expressions
+
+        The expressions carry their values, for statements that are not
+        cached, such as the UPDATE of restock_where().
+
+        Args:
+            kwargs: parameters of the query string
+        """
+        params = cls.filter_params(**kwargs)
+        return filter_criteria(cls, API_FIELDS, tuple(params), params)
+
+    @classmethod
+    def filter_params(cls, **kwargs) -> dict:
+        """Converts query string parameters into the values of bound parameters
+
+        Each key is an API field, optionally followed by __ and one of the
+        FILTER_OPERATORS, e.g. quantity__lt=5, condition__in=NEW,USED or
+        name__prefix=comp. Values are converted to the column's type so the
+        database compares like with like and can use its indexes. The keys
+        come back sorted, so they also name the shape of the query.
+
+        Args:
+            kwargs: parameters of the query string
+
+        Raises:
+            DataValidationError: for an unknown field or operator, or a bad value
+        """
+        params = {}
+        for key in sorted(kwargs):
+            name, operator = parse_filter_key(key, API_FIELDS)
+            column = getattr(cls, name)
+            if operator == "prefix" and column.type.python_type is not str:
+                raise DataValidationError(f"Only text fields can be matched by prefix: {key}")
+            if operator == "in":
+                value = [filter_value(column, item) for item in kwargs[key].split(",")]
+            elif operator == "prefix":
+                value = like_prefix(kwargs[key])
+            else:
+                value = filter_value(column, kwargs[key])
+            params[key] = value
+        logger.info("Processing query for %s ...", ", ".join(params))
+        return params
+
+    @classmethod
+    def filtered_statement(cls, purpose, params, build):
+        """Returns the cached statement for a purpose and the keys of params
+
+        Args:
+            purpose: what the statement is for, plus anything else that
+                changes its SQL
+            params (dict): the bound parameters from filter_params()
+            build (function): makes the statement from a list of filter criteria
+        """
+        shape = tuple(params)
+        return statement_cache.get_or_build(
+            (purpose, shape), lambda: build(filter_criteria(cls, API_FIELDS, shape))
+        )
@@ -0,0 +1,133 @@
+"""
+SQL Timing
+
+This module records how many statements each request runs, how long they
+take in total and which one was the slowest. The totals are sent back in a
+Server-Timing header, and requests or statements over the configured
+thresholds are logged, optionally with the query plan of the statement.
+"""
+import logging
+import random
+import time
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("flask.app")
+
+# Statements that EXPLAIN describes without side effects
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+# Longest statement text written to the log
+MAX_STATEMENT_LOG = 500
+
+
+def init_sql_timing(app):
+    """Starts timing the SQL of every request of the app"""
+    app.before_request(start_request)
+    app.after_request(finish_request)
+
+
+def start_request():
+    """Resets the SQL totals for a new request"""
+    g.sql_started = time.perf_counter()
+    g.sql_count = 0
+    g.sql_time = 0.0
+    g.sql_slowest = (0.0, None)
+
+
+def finish_request(response):
+    """Adds the Server-Timing header and logs a slow or chatty request"""
+    if "sql_started" not in g:
+        return response
+    total = time.perf_counter() - g.sql_started
+    slowest_time, slowest = g.sql_slowest
+    config = current_app.config
+    if config["SERVER_TIMING"]:
+        response.headers.add(
+            "Server-Timing",
+            f'db;dur={g.sql_time * 1000:.2f};desc="{g.sql_count} queries", '
+            f"db-slowest;dur={slowest_time * 1000:.2f}, app;dur={total * 1000:.2f}",
+        )
+    if total * 1000 >= config["SLOW_REQUEST_MS"] or g.sql_count > config["MAX_REQUEST_QUERIES"]:
+        logger.warning(
+            "Slow request %s %s: %.1f ms, %d queries taking %.1f ms, slowest %.1f ms: %s",
+            request.method,
+            request.full_path,
+            total * 1000,
+            g.sql_count,
+            g.sql_time * 1000,
+            slowest_time * 1000,
+            shorten(slowest),
+        )
+    return response
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_query(conn, cursor, statement, parameters, context, executemany):  # pylint: disable=unused-argument
+    """Marks the start of a statement run for a request"""
+    if has_request_context():
+        context.sql_timing_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def end_query(conn, cursor, statement, parameters, context, executemany):  # pylint: disable=unused-argument
+    """Adds a statement to the request's totals and logs it when it is slow"""
+    started = getattr(context, "sql_timing_started", None)
+    if started is None or "sql_started" not in g:
+        return
+    elapsed = time.perf_counter() - started
+    g.sql_count += 1
+    g.sql_time += elapsed
+    if elapsed > g.sql_slowest[0]:
+        g.sql_slowest = (elapsed, statement)
+    config = current_app.config
+    if elapsed * 1000 < config["SLOW_QUERY_MS"]:
+        return
+    logger.warning("Slow query %.1f ms: %s", elapsed * 1000, shorten(statement))
+    if not executemany and random.random() < config["EXPLAIN_SAMPLE_RATE"]:
+        plan = explain(conn.dialect.name, cursor.connection, statement, parameters)
+        if plan:
+            logger.warning("Query plan:\n%s", plan)
+
+
+def explain(dialect, dbapi_connection, statement, parameters):
+    """Returns the query plan of a statement as text, or None if it has none
+
+    The plan is read on a separate DBAPI cursor of the same connection, so it
+    runs in the same transaction without firing the engine events again. A
+    failed statement aborts a PostgreSQL transaction, so there it runs inside
+    a savepoint that is rolled back when EXPLAIN fails.
+    """
+    if statement.lstrip().split(None, 1)[0].upper() not in EXPLAINABLE:
+        return None
+    prefix = "EXPLAIN QUERY PLAN " if dialect == "sqlite" else "EXPLAIN "
+    savepoint = dialect == "postgresql" and not getattr(dbapi_connection, "autocommit", False)
+    cursor = dbapi_connection.cursor()
+    try:
+        if savepoint:
+            cursor.execute("SAVEPOINT explain_plan")
+        try:
+            cursor.execute(prefix + statement, parameters)
+            plan = "\n".join(str(row[-1]) for row in cursor.fetchall())
+        except Exception:
+            if savepoint:
+                cursor.execute("ROLLBACK TO SAVEPOINT explain_plan")
+            raise
+        finally:
+            if savepoint:
+                cursor.execute("RELEASE SAVEPOINT explain_plan")
+        return plan
+    except Exception as error:  # pylint: disable=broad-except
+        logger.warning("Could not explain the query: %s", error)
+        return None
+    finally:
+        cursor.close()
+
+
+def shorten(statement):
+    """Returns the statement on one line, cut to MAX_STATEMENT_LOG characters"""
+    if statement is None:
+        return ""
+    text = " ".join(statement.split())
+    return text if len(text) <= MAX_STATEMENT_LOG else text[:MAX_STATEMENT_LOG] + "..."
@@ -0,0 +1,112 @@
+"""
+Inventory Write Statements
+
+The single statement writes of the Inventory model, built here once and
+run by both the sync methods in service.models and the async ones in
+service.common.async_db. InventoryStatements is a mixin of
+service.models.Inventory.
+"""
+from datetime import date
+from sqlalchemy.dialects import postgresql, sqlite
+from service.common.database import db, utcnow
+from service.common.queries import API_FIELDS
+
+
+class InventoryStatements:
+    """Statements of the Inventory model that write Products"""
+
+    def replace_statement(self, versions=None):
+        """Returns the UPDATE ... RETURNING of replace()"""
+        table = self.__table__
+        criteria = [table.c.id == self.id]
+        if versions is not None:
+            criteria.append(self.version_criterion(versions))
+        return (
+            db.update(table)
+            .where(*criteria)
+            .values(
+                name=self.name,
+                quantity=self.quantity,
+                restock_level=self.restock_level,
+                restock_count=self.restock_count,
+                condition=self.condition,
+                first_entry_date=self.first_entry_date,
+                last_restock_date=self.last_restock_date,
+            )
+            .returning(*table.c)
+        )
+
+    def insert_new_statement(self, engine):
+        """Returns the INSERT ... ON CONFLICT DO NOTHING RETURNING of insert_new()"""
+        table = self.__table__
+        return (
+            dialect_insert(engine)(table)
+            .values(self.column_values())
+            .on_conflict_do_nothing(index_elements=[table.c.id])
+            .returning(*table.c)
+        )
+
+    def upsert_statement(self, engine):
+        """Returns the INSERT ... ON CONFLICT DO UPDATE RETURNING of upsert()"""
+        table = self.__table__
+        insert = dialect_insert(engine)(table).values(self.column_values())
+        return insert.on_conflict_do_update(
+            index_elements=[table.c.id], set_=upsert_values(insert)
+        ).returning(*table.c)
+
+    @classmethod
+    def version_criterion(cls, versions):
+        """Returns a filter matching a Product in one of the states an ETag names
+
+        Args:
+            versions (list): (version, updated_at) pairs; an empty list matches nothing
+        """
+        return db.or_(
+            db.false(),
+            *(
+                db.and_(cls.version == version, cls.updated_at == updated_at)
+                for version, updated_at in versions
+            ),
+        )
+
+    @classmethod
+    def restock_statement(cls, *criteria):
+        """Returns the UPDATE ... RETURNING of restock_where()"""
+        table = cls.__table__
+        below = table.c.quantity < table.c.restock_level
+        return (
+            db.update(table)
+            .where(*criteria)
+            .values(
+                quantity=db.case(
+                    (below, table.c.restock_level),
+                    else_=table.c.quantity + table.c.restock_count,
+                ),
+                last_restock_amount=db.case(
+                    (below, table.c.restock_level - table.c.quantity),
+                    else_=table.c.restock_count,
+                ),
+                last_restock_date=date.today(),
+            )
+            .returning(*table.c)
+        )
+
+
+def dialect_insert(connection):
+    """Returns the insert() of a connection or engine's dialect, which has on_conflict_do_update()"""
+    inserts = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+    if connection.dialect.name not in inserts:
+        raise NotImplementedError(f"Upserts are not supported on {connection.dialect.name}")
+    return inserts[connection.dialect.name]
+
+
+def upsert_values(insert) -> dict:
+    """Returns the SET clause of an upsert into inventory from its excluded row
+
+    Column onupdate values are not applied to ON CONFLICT DO UPDATE, so the
+    version and update time are set here.
+    """
+    values = {name: insert.excluded[name] for name in API_FIELDS if name != "id"}
+    values["version"] = insert.table.c.version + 1
+    values["updated_at"] = utcnow()
+    return values
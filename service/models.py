@@ -1,17 +1,37 @@
 """
 Models for Inventory
 
-All of the models are stored in this module
+All of the models are stored in this module. The read queries, the write
+statements and the async methods of Inventory are mixins from
+service.common; the summary counters are in service.stats.
 """
 import logging
+import time
 from enum import Enum
 from datetime import date
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import MetaData, exc, inspect
+from sqlalchemy.schema import CreateIndex, DropIndex
+from service.common.async_db import InventoryAsync
+from service.common.cache import item_cache
+from service.common.database import db, utcnow, DataValidationError, DatabaseConnectionError
+from service.common.encoder import RowEncoder
+from service.common.pool import TimedQueuePool
+from service.common.queries import InventoryQueries
+from service.common.statements import InventoryStatements
 
 logger = logging.getLogger("flask.app")
 
-# Create the SQLAlchemy object to be initialized later in init_db()
-db = SQLAlchemy()
+# Range of the INTEGER columns, which PostgreSQL stores in 32 bits
+MIN_INTEGER = -(2**31)
+MAX_INTEGER = 2**31 - 1
+
+# Secondary indexes that are only created on one database, by name
+DIALECT_INDEXES = {"ix_inventory_name_pattern": "postgresql"}
+
+# Writes rows of the API columns straight to JSON
+row_encoder = RowEncoder(
+    enum_fields=("condition",), date_fields=("first_entry_date", "last_restock_date")
+)
 
 
 # Function to initialize the database
@@ -20,14 +40,6 @@ def init_db(app):
     Inventory.init_db(app)
 
 
-class DataValidationError(Exception):
-    """Used for an data validation errors when deserializing"""
-
-
-class DatabaseConnectionError(Exception):
-    """Custom Exception when database connection fails"""
-
-
 class Condition(Enum):
     """Enumeration of valid product Conditions"""
 
@@ -37,12 +49,28 @@ class Condition(Enum):
 
 
 # pylint: disable=invalid-name, too-many-instance-attributes
-class Inventory(db.Model):
+class Inventory(InventoryQueries, InventoryStatements, InventoryAsync, db.Model):
     """
     Class that represents a Product
     """
 
     app = None
+    # whether wait_for_db() has reached the database
+    ready = False
+
+    # Secondary indexes for the columns find_by_queries filters on most.
+    # The composite index also serves queries on condition alone.
+    __table_args__ = (
+        db.Index("ix_inventory_name", "name"),
+        # name__prefix uses LIKE 'x%', which PostgreSQL only serves from an index
+        # with C ordering when the database collation is not C
+        db.Index(
+            "ix_inventory_name_pattern", "name", postgresql_ops={"name": "text_pattern_ops"}
+        ).ddl_if(dialect=DIALECT_INDEXES["ix_inventory_name_pattern"]),
+        db.Index("ix_inventory_last_restock_date", "last_restock_date"),
+        db.Index("ix_inventory_condition", "condition"),
+        db.Index("ix_inventory_condition_quantity", "condition", "quantity"),
+    )
 
     # Table Schema
     id = db.Column(db.Integer, primary_key=True)
@@ -56,6 +84,14 @@ class Inventory(db.Model):
     )
     first_entry_date = db.Column(db.Date(), nullable=False, default=date.today())
     last_restock_date = db.Column(db.Date(), nullable=False, default=date.today())
+    # units added by the most recent restock, written by the same UPDATE
+    last_restock_amount = db.Column(db.Integer, nullable=False, default=0)
+    # set on every insert and update, including set based UPDATE statements
+    updated_at = db.Column(db.DateTime(), nullable=False, default=utcnow, onupdate=utcnow)
+    # bumped by every UPDATE, for optimistic concurrency control
+    version = db.Column(
+        db.Integer, nullable=False, default=1, onupdate=db.literal_column("version + 1")
+    )
 
     def __repr__(self):
         return f"<Product {self.id} id=[{self.id}]>"
@@ -68,6 +104,23 @@ class Inventory(db.Model):
         # self.id = None  # pylint: disable=invalid-name
         db.session.add(self)
         db.session.commit()
+        item_cache.invalidate(int(self.id))
+
+    @classmethod
+    def create_many(cls, products):
+        """
+        Creates a batch of Products with one batched INSERT and a single commit
+
+        Args:
+            products (list): deserialized Inventory objects that do not exist yet
+        """
+        logger.info("Creating %d products in bulk", len(products))
+        if not products:
+            return
+        rows = [product.column_values() for product in products]
+        db.session.execute(db.insert(cls), rows)
+        db.session.commit()
+        item_cache.invalidate(*(int(row["id"]) for row in rows))
 
     def update(self):
         """
@@ -75,12 +128,79 @@ class Inventory(db.Model):
         """
         logger.info("Saving %s", self.id)
         db.session.commit()
+        item_cache.invalidate(int(self.id))
+
+    def replace(self, versions=None):
+        """
+        Overwrites the stored Product that has this id with one UPDATE ... RETURNING
+
+        Args:
+            versions (list): when given, only a stored Product whose
+                (version, updated_at) is one of these pairs is overwritten
+
+        Returns the stored Product, or None if no row matched
+        """
+        logger.info("Replacing %s", self.id)
+        row = db.session.execute(self.replace_statement(versions)).one_or_none()
+        db.session.commit()
+        item_cache.invalidate(int(self.id))
+        return None if row is None else Inventory(**row._asdict())
+
+    def insert_new(self):
+        """
+        Creates a Product with one INSERT ... ON CONFLICT DO NOTHING RETURNING
+
+        The database detects a taken id, so there is no window between a
+        check and the insert. Returns the stored Product, or None if the id
+        was already taken and nothing was written. Every Product is created
+        with the id it was given: explicit ids do not advance a PostgreSQL
+        sequence, so a number drawn from it could already be taken.
+
+        Raises:
+            DataValidationError: when the id is missing or is not an integer
+        """
+        logger.info("Inserting %s", self.id)
+        self.check_new_id()
+        row = db.session.execute(self.insert_new_statement(db.engine)).one_or_none()
+        db.session.commit()
+        if row is None:
+            return None
+        item_cache.invalidate(row.id)
+        return Inventory(**row._asdict())
+
+    def check_new_id(self):
+        """Raises DataValidationError unless the id is an integer"""
+        if not isinstance(self.id, int) or isinstance(self.id, bool):
+            raise DataValidationError("Invalid Product: id must be an integer")
+
+    def upsert(self):
+        """
+        Creates or overwrites the Product with this id in one statement
+
+        Uses INSERT ... ON CONFLICT DO UPDATE ... RETURNING. Returns the stored
+        Product, whose version is 1 when it was created by this call.
+        """
+        logger.info("Upserting %s", self.id)
+        row = db.session.execute(self.upsert_statement(db.engine)).one()
+        db.session.commit()
+        item_cache.invalidate(int(self.id))
+        return Inventory(**row._asdict())
+
+    def column_values(self) -> dict:
+        """Returns the column values that are set, for Core INSERT statements"""
+        values = {}
+        for column in self.__table__.columns:
+            value = getattr(self, column.key)
+            if value is not None:
+                values[column.key] = value
+        return values
 
     def delete(self):
         """Removes a Product from the data store"""
         logger.info("Deleting %s", self.id)
         db.session.delete(self)
         db.session.commit()
+        item_cache.invalidate(int(self.id))
 
     def serialize(self):
         """Serializes a Product into a dictionary"""
@@ -99,19 +219,30 @@ class Inventory(db.Model):
         """
         Deserializes a Product from a dictionary
 
+        Every field is checked against its column, so a Product that passes
+        can be written without a database error. Integers may also be given
+        as strings of digits, as the HTML forms of the UI send them.
+
         Args:
             data (dict): A dictionary containing the resource data
         """
         try:
-            self.id = data["id"]
-            if "name" in data:
-                self.name = data["name"]
-            else:
-                self.name = None  # product name can be none
-            self.quantity = data["quantity"]
-            self.restock_level = data["restock_level"]
-            self.restock_count = data["restock_count"]
-            self.condition = getattr(Condition, data["condition"])
+            self.id = integer_field(data, "id")
+            self.name = data.get("name")  # product name can be none
+            if self.name is not None and (
+                not isinstance(self.name, str) or len(self.name) > Inventory.name.type.length
+            ):
+                raise DataValidationError(
+                    f"Invalid Product: name must be text of at most {Inventory.name.type.length} characters"
+                )
+            self.quantity = integer_field(data, "quantity")
+            self.restock_level = integer_field(data, "restock_level")
+            self.restock_count = integer_field(data, "restock_count")
+            if data["condition"] not in Condition.__members__:
+                raise DataValidationError(
+                    f"Invalid Product: condition must be one of {', '.join(Condition.__members__)}"
+                )
+            self.condition = Condition[data["condition"]]
             self.first_entry_date = date.fromisoformat(data["first_entry_date"])
             self.last_restock_date = date.fromisoformat(data["last_restock_date"])
 
@@ -122,7 +253,11 @@ class Inventory(db.Model):
         except TypeError as error:
             raise DataValidationError(
                 "Invalid Product: body of request contained bad or no data - "
-                "Error message: " + error
+                "Error message: " + str(error)
+            ) from error
+        except ValueError as error:
+            raise DataValidationError(
+                "Invalid Product: bad date - " + str(error)
             ) from error
         except AttributeError as error:
             raise DataValidationError(
@@ -132,13 +267,94 @@ class Inventory(db.Model):
 
     @classmethod
     def init_db(cls, app):
-        """Initializes the database session"""
+        """Initializes the database session
+
+        Nothing connects to the database here, so importing the service stays
+        fast and works while the database is down. The tables are created by
+        create_schema(), run from flask db-init, and wait_for_db() checks the
+        connection before the first request.
+        """
         logger.info("Initializing database")
         cls.app = app
-        # This is where we initialize SQLAlchemy from the Flask app
-        db.init_app(app)
+        options = app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {})
+        if "pool_size" in options:
+            options.setdefault("poolclass", TimedQueuePool)
+        # This is where we initialize SQLAlchemy from the Flask app, which
+        # Flask only allows once and before the app has served a request
+        if "sqlalchemy" not in app.extensions:
+            db.init_app(app)
         app.app_context().push()
-        db.create_all()  # make our sqlalchemy tables
+
+    @classmethod
+    def create_schema(cls):
+        """Creates the tables, indexes and stats triggers that do not exist yet
+
+        Columns added to inventory since it was first created are added to an
+        existing table too, see add_missing_columns().
+        """
+        logger.info("Creating the database schema")
+        db.create_all()
+        with db.engine.begin() as connection:
+            for name in add_missing_columns(connection):
+                logger.info("Added column %s to inventory", name)
+
+    @classmethod
+    def wait_for_db(cls, retries=1, delay=0.1, max_delay=1.0):
+        """Connects to the database, retrying with exponential backoff
+
+        Args:
+            retries (int): the most connection attempts to make
+            delay (float): seconds to wait after the first failed attempt; the
+                wait doubles after each further one
+            max_delay (float): the longest wait between two attempts
+
+        Raises:
+            DatabaseConnectionError: when every attempt failed
+        """
+        retries = max(retries, 1)
+        for attempt in range(1, retries + 1):
+            try:
+                with db.engine.connect() as connection:
+                    connection.execute(db.text("SELECT 1"))
+            except exc.DBAPIError as error:
+                logger.warning("Database connection attempt %d of %d failed: %s", attempt, retries, error)
+                if attempt == retries:
+                    cls.ready = False
+                    raise DatabaseConnectionError(
+                        f"Could not connect to the database after {retries} attempts"
+                    ) from error
+                time.sleep(min(delay * 2 ** (attempt - 1), max_delay))
+            else:
+                cls.ready = True
+                return
+
+    @classmethod
+    def create_indexes(cls) -> list:
+        """Creates any of the secondary indexes that do not exist yet
+
+        On PostgreSQL the indexes are built with CREATE INDEX CONCURRENTLY so
+        writes to the table are not blocked while they build. That option is
+        set on a copy of the table in a MetaData of its own, so the indexes
+        create_all() uses are left as they are. A concurrent build that failed
+        leaves an INVALID index behind, which is dropped and built again.
+        Returns the names of the indexes that were checked.
+        """
+        table = cls.__table__.to_metadata(MetaData())
+        names = []
+        with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            invalid = invalid_indexes(conn)
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                dialect = DIALECT_INDEXES.get(index.name)
+                if dialect and conn.dialect.name != dialect:
+                    continue  # an index for another database
+                index.dialect_options["postgresql"]["concurrently"] = True
+                if index.name in invalid:
+                    logger.warning("Dropping invalid index %s", index.name)
+                    conn.execute(DropIndex(index, if_exists=True))
+                logger.info("Creating index %s", index.name)
+                conn.execute(CreateIndex(index, if_not_exists=True))
+                names.append(index.name)
+        return names
 
     @classmethod
     def all(cls):
@@ -155,6 +371,40 @@ class Inventory(db.Model):
         logger.info("Processing lookup for id %s ...", by_id)
         return db.session.get(cls, by_id)
 
+    @classmethod
+    def restock(cls, by_id, versions=None):
+        """Restocks a Product in one statement
+
+        Args:
+            by_id (int): the id of the Product to restock
+            versions (list): when given, only restock if the Product's
+                (version, updated_at) is one of these pairs
+
+        Returns the restocked Product or None if no Product matched
+        """
+        logger.info("Processing restock for id %s ...", by_id)
+        criteria = [cls.id == by_id]
+        if versions is not None:
+            criteria.append(cls.version_criterion(versions))
+        products = cls.restock_where(*criteria)
+        return products[0] if products else None
+
+    @classmethod
+    def restock_where(cls, *criteria) -> list:
+        """Restocks every Product matching the criteria with a single UPDATE ... RETURNING
+
+        A Product below its restock level is filled up to that level, any other
+        Product gets restock_count more units. The rule runs inside the database,
+        so concurrent restocks of the same Product never lose an update.
+
+        Args:
+            criteria: SQL expressions selecting the Products to restock
+        """
+        rows = db.session.execute(cls.restock_statement(*criteria)).all()
+        db.session.commit()
+        item_cache.invalidate(*(row.id for row in rows))
+        return [cls(**row._asdict()) for row in rows]
+
     @classmethod
     def find_by_name(cls, name):
         """Returns all Products with the given name
@@ -167,23 +417,15 @@ class Inventory(db.Model):
         logger.info("Processing name query for %s ...", name)
         return cls.query.filter(cls.name == name)
 
-    @classmethod
-    def find_by_queries(cls, **kwargs) -> list:
-        """Returns all Customers with the given information
 
-        Args:
-            kwargs: parameters of the query string
-        """
-        query = cls.query
-        log_info = ""
-        for key, value in kwargs.items():
-            if hasattr(cls, key):
-                if key == "condition":
-                    value = condition_handler(value)
-                query = query.filter(getattr(cls, key) == value)
-                log_info += key + ", "
-        logger.info("Processing query for %s ...", log_info)
-        return query.all()
+# Partial index over the items below their restock level, in shortfall order
+db.Index(
+    "ix_inventory_low_stock",
+    Inventory.restock_level - Inventory.quantity,
+    Inventory.id,
+    postgresql_where=Inventory.quantity < Inventory.restock_level,
+    sqlite_where=Inventory.quantity < Inventory.restock_level,
+)
 
 
 ######################################################################
@@ -191,15 +433,69 @@ class Inventory(db.Model):
 ######################################################################
 
 
-def condition_handler(condition):
-    """Converts the condition string to proper format
+def integer_field(data, key) -> int:
+    """Returns a field of a Product document that must fit an INTEGER column
+
+    Raises:
+        KeyError: when the field is missing
+        DataValidationError: when it is not an integer, or a string of one, in range
+    """
+    value = data[key]
+    if isinstance(value, str) and value.strip().lstrip("-").isdigit():
+        value = int(value)
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise DataValidationError(f"Invalid Product: {key} must be an integer")
+    if not MIN_INTEGER <= value <= MAX_INTEGER:
+        raise DataValidationError(f"Invalid Product: {key} is out of range")
+    return value
+
+
+def invalid_indexes(connection) -> set:
+    """Returns the names of the inventory indexes PostgreSQL marked INVALID
+
+    CREATE INDEX CONCURRENTLY leaves such an index behind when it fails; it is
+    kept up to date by writes but never used by queries. Other databases have
+    no invalid indexes.
+    """
+    if connection.dialect.name != "postgresql":
+        return set()
+    return set(
+        connection.execute(
+            db.text(
+                "SELECT index_class.relname FROM pg_index"
+                " JOIN pg_class AS index_class ON index_class.oid = pg_index.indexrelid"
+                " WHERE pg_index.indrelid = CAST(:table AS regclass) AND NOT pg_index.indisvalid"
+            ),
+            {"table": Inventory.__tablename__},
+        ).scalars()
+    )
+
+
+def add_missing_columns(connection) -> list:
+    """Adds the inventory columns that a table from an older release lacks
+
+    Each column is NOT NULL with a constant DEFAULT, which fills the existing
+    rows; PostgreSQL 11 and later do that without rewriting the table. On
+    PostgreSQL IF NOT EXISTS also keeps concurrent runs from failing.
 
-    Args:
-        condition (string): the condition of the Product you want to match
-        It can be either int or string.
+    Returns:
+        list: the names of the columns that were added
     """
-    if str.isdigit(condition):
-        condition = Condition(int(condition))
-    else:
-        condition = getattr(Condition, str.upper(condition))
-    return condition
+    defaults = {
+        "last_restock_amount": "0",
+        "version": "1",
+        "updated_at": f"'{utcnow():%Y-%m-%d %H:%M:%S.%f}'",
+    }
+    existing = {column["name"] for column in inspect(connection).get_columns(Inventory.__tablename__)}
+    if_not_exists = "IF NOT EXISTS " if connection.dialect.name == "postgresql" else ""
+    added = []
+    for name, default in defaults.items():
+        if name in existing:
+            continue
+        column_type = Inventory.__table__.c[name].type.compile(dialect=connection.dialect)
+        connection.exec_driver_sql(
+            f"ALTER TABLE {Inventory.__tablename__} ADD COLUMN {if_not_exists}{name} "
+            f"{column_type} NOT NULL DEFAULT {default}"
+        )
+        added.append(name)
+    return added
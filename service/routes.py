@@ -4,25 +4,108 @@ My Service
 Describe what your service does here
 """
 
-from datetime import datetime
-from flask import jsonify, request, abort
+import base64
+import json
+from functools import partial
+from flask import Response, jsonify, request, abort, stream_with_context
 from flask_restx import Resource, fields
-from service.common import status  # HTTP Status Codes
-from service.models import Inventory, Condition
+from werkzeug.http import quote_etag
+from service.common import conditional, metrics, status  # HTTP Status Codes
+from service.common.conditional import content_etag, item_etag, precondition_failed
+from service.common.cache import item_cache, statement_cache
+from service.common.pool import TimedQueuePool
+from service.common.queries import API_FIELDS, IN_CLAUSE_BATCH_SIZE
+from service.models import (
+    MAX_INTEGER,
+    MIN_INTEGER,
+    db,
+    Inventory,
+    Condition,
+    DataValidationError,
+    row_encoder,
+)
+from service.stats import InventoryStats
 
 # Import Flask application
 from . import app, api
 
+# Flask responses from the helpers shared with the ASGI app
+json_response = partial(conditional.json_response, Response)
+not_modified = partial(conditional.not_modified, Response)
+
 
 ############################################################
 # Health Endpoint
 ############################################################
 @app.route("/health")
 def health():
-    """Health Status"""
+    """Health Status, which is 503 until the database can be reached
+
+    The probe makes a single connection attempt, bounded by DB_CONNECT_TIMEOUT,
+    instead of the retries of wait_for_database(), so it answers within the
+    timeout of the readiness probe.
+    """
+    if not Inventory.ready:
+        Inventory.wait_for_db()
     return jsonify(status="OK"), status.HTTP_200_OK
 
 
+# Endpoints that never touch the database, served while it is unreachable
+NO_DATABASE_ENDPOINTS = {"health", "prometheus_metrics", "cache_stats", "statement_stats", "pool_stats", "static"}
+
+
+def wait_for_database():
+    """Waits for the database before the first request of this worker that needs it
+
+    The wait is bounded by RETRY_COUNT attempts with exponential backoff; when
+    they all fail the request gets a 503 and the next request tries again.
+    """
+    if Inventory.ready or request.endpoint in NO_DATABASE_ENDPOINTS:
+        return
+    Inventory.wait_for_db(
+        app.config["RETRY_COUNT"], app.config["RETRY_DELAY"], app.config["RETRY_MAX_DELAY"]
+    )
+
+
+############################################################
+# Item Cache Statistics Endpoint
+############################################################
+@app.route("/stats/cache")
+def cache_stats():
+    """Hit, miss and eviction counters of this worker's item cache"""
+    return jsonify(item_cache.stats()), status.HTTP_200_OK
+
+
+############################################################
+# Statement Cache Statistics Endpoint
+############################################################
+@app.route("/stats/statements")
+def statement_stats():
+    """Hit, miss and eviction counters of this worker's query statement cache"""
+    return jsonify(statement_cache.stats()), status.HTTP_200_OK
+
+
+############################################################
+# Connection Pool Statistics Endpoint
+############################################################
+@app.route("/stats/pool")
+def pool_stats():
+    """Occupancy and checkout wait times of this worker's connection pool"""
+    pool = db.engine.pool
+    if isinstance(pool, TimedQueuePool):
+        return jsonify(pool.stats()), status.HTTP_200_OK
+    return jsonify(status=pool.status()), status.HTTP_200_OK
+
+
+############################################################
+# Prometheus Metrics Endpoint
+############################################################
+@app.route("/metrics")
+def prometheus_metrics():
+    """Request, database and cache metrics in the Prometheus text format"""
+    return Response(metrics.render(), status=status.HTTP_200_OK, content_type=metrics.CONTENT_TYPE)
+
+
 ######################################################################
 # Configure the Root route before OpenAPI
 ######################################################################
@@ -41,6 +124,9 @@ def index():
     """Base URL for our service"""
     return app.send_static_file("index.html")
 
+
+FIELDS_DOC = f"Comma separated fields to return; id is always included ({', '.join(API_FIELDS)})"
+
 # Define the model so that the docs reflect what can be sent
 
 
@@ -72,6 +158,21 @@ inventory_model = api.model(
     },
 )
 
+stats_model = api.model(
+    "InventoryStats",
+    {
+        "items": fields.Integer(description="The number of products"),
+        "units": fields.Integer(description="The units in stock over all products"),
+        "below_restock_level": fields.Integer(
+            description="The number of products whose quantity is below their restock level"
+        ),
+        "last_restock_date": fields.Date(description="The most recent restock date"),
+        "conditions": fields.Raw(
+            description="The items and units of each condition, e.g. {\"NEW\": {\"items\": 1, \"units\": 5}}"
+        ),
+    },
+)
+
 # inventory_model = api.inherit(
 #     "InventoryModel",
 #     create_model,
@@ -103,45 +204,79 @@ class InventoryResource(Resource):
     # ------------------------------------------------------------------
     # RETRIEVE A INVENTORY
     # ------------------------------------------------------------------
-    @api.doc("get_inventory")
+    @api.doc("get_inventory", params={"fields": FIELDS_DOC})
+    @api.response(200, "Success", inventory_model)
+    @api.response(304, "Not modified since the ETag in If-None-Match")
+    @api.response(400, "The fields were not valid")
     @api.response(404, "Item not found")
-    @api.marshal_with(inventory_model)
     def get(self, iid):
-        """Gets a product with specified id"""
+        """
+        Gets a product with specified id
+
+        The response carries an ETag built from the product's version; sending
+        it back in If-None-Match returns 304 Not Modified while it is unchanged.
+        """
         app.logger.info("Request to get product with id %s...", iid)
-        ans = Inventory.find(iid)
-        if ans is None:
-            abort(status.HTTP_404_NOT_FOUND, f"Product {iid} does not exist")
+        key = item_key(iid)
+        field_names = parse_fields(request.args.get("fields"))
+        if field_names is not None:
+            return get_item_fields(key, field_names)
+        cached = item_cache.get(key)
+        if cached is None:
+            generation = item_cache.generation()
+            ans = Inventory.find(key)
+            if ans is None:
+                abort(status.HTTP_404_NOT_FOUND, f"Product {iid} does not exist")
+            cached = (item_etag(ans), row_encoder.dumps(ans.serialize()))
+            item_cache.put(key, cached, generation)
+        etag, body = cached
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag)
         app.logger.info("Returning: product %s...", iid)
-        return ans.serialize(), status.HTTP_200_OK
+        return json_response(body, status.HTTP_200_OK, {"ETag": quote_etag(etag)})
 
     # ------------------------------------------------------------------
     # UPDATE AN EXISTING INVENTORY
     # ------------------------------------------------------------------
-    @api.doc("update_inventory")
+    @api.doc(
+        "update_inventory",
+        params={"upsert": "true to create the product when it does not exist"},
+    )
+    @api.response(201, "Created", inventory_model)
     @api.response(404, "Inventory not found")
     @api.response(400, "The posted Inventory data was not valid")
+    @api.response(412, "The ETag in If-Match is not the current version")
     @api.expect(inventory_model)
-    @api.marshal_with(inventory_model)
+    @api.response(200, "Success", inventory_model)
     def put(self, iid):
         """
         Update a product
 
-        This endpoint will update a product based the body that is posted
+        This endpoint will update a product based the body that is posted.
+        With an If-Match header it only updates the version that ETag names.
+        With ?upsert=true a missing product is created instead of returning 404.
         """
         app.logger.info("Request to update product with id: %s", iid)
         check_content_type("application/json")
-
-        product = Inventory.find(iid)
-        if not product:
+        key = item_key(iid)
+
+        product = Inventory().deserialize(request.get_json())
+        product.id = key  # to undo deserialize's id field, so update won't change id
+        versions = conditional.if_match_versions(request.headers.get("If-Match"))
+        if versions is None and request.args.get("upsert", "").lower() == "true":
+            return upsert_product(product)
+        product = product.replace(versions)
+        if product is None:
+            if versions is not None:
+                precondition_failed(key, Inventory.find(key))
             abort(status.HTTP_404_NOT_FOUND, f"Product with id '{iid}' was not found.")
 
-        product.deserialize(request.get_json())
-        product.id = iid  # to undo deserialize's id field, so update won't change id
-        product.update()
-
         app.logger.info("Product with ID [%s] updated.", product.id)
-        return product.serialize(), status.HTTP_200_OK
+        return json_response(
+            row_encoder.dumps(product.serialize()),
+            status.HTTP_200_OK,
+            {"ETag": quote_etag(item_etag(product))},
+        )
 
     # ------------------------------------------------------------------
     # DELETE A INVENTORY
@@ -152,7 +287,8 @@ class InventoryResource(Resource):
         """Delete a product from the inventory"""
         app.logger.info("Request to delete product with id: %s", iid)
 
-        product = Inventory.find(iid)
+        key = stored_id(iid)
+        product = Inventory.find(key) if key is not None else None
         if not product:
             return "", status.HTTP_204_NO_CONTENT
 
@@ -172,15 +308,47 @@ class InventoryCollection(Resource):
     # ------------------------------------------------------------------
     # LIST ALL INVENTORY
     # ------------------------------------------------------------------
-    @api.doc("list_inventory")
-    @api.marshal_list_with(inventory_model)
+    @api.doc(
+        "list_inventory",
+        params={
+            "limit": "The most products to return, capped by the server's maximum page size",
+            "cursor": "Opaque cursor taken from the previous page's Link header",
+            "fields": FIELDS_DOC,
+        },
+    )
+    @api.response(200, "Success", [inventory_model])
+    @api.response(304, "Not modified since the ETag in If-None-Match")
+    @api.response(400, "The limit, cursor or fields were not valid")
     def get(self):
-        """Retrieves all products from the inventory"""
+        """
+        Retrieves one page of products from the inventory
+
+        Products are returned in id order and can be filtered with field=value
+        or field__op=value, where op is ne, lt, lte, gt, gte, in (comma
+        separated values) or prefix. When there are more, a Link header
+        with rel="next" points to the following page. The ETag changes whenever
+        a product on the page, or the first one after it, is created, updated
+        or deleted.
+        """
         app.logger.info("Request to list all products")
-        products = Inventory.find_by_queries(**request.args)
-        results = [product.serialize() for product in products]
-        app.logger.info("Returning %d products", len(results))
-        return results, status.HTTP_200_OK
+        filters = request.args.to_dict()
+        limit = page_limit(filters.pop("limit", None))
+        position = decode_cursor(filters.pop("cursor", None), "id")
+        after = position["id"] if position else None
+        field_names = parse_fields(filters.pop("fields", None))
+        # one extra row tells us whether there is a next page
+        fingerprint = Inventory.fingerprint(limit + 1, after=after, **filters)
+        etag = content_etag([request.full_path, *map(str, fingerprint)])
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag)
+        products = Inventory.find_page(limit + 1, after=after, fields=field_names, **filters)
+        headers = {"ETag": quote_etag(etag)}
+        if len(products) > limit:
+            products = products[:limit]
+            params = dict(filters, fields=",".join(field_names)) if field_names else filters
+            headers.update(next_page_headers(InventoryCollection, limit, params, id=products[-1].id))
+        app.logger.info("Returning %d products", len(products))
+        return json_response(row_encoder.encode_rows(products), status.HTTP_200_OK, headers)
 
     # ------------------------------------------------------------------
     # ADD A NEW INVENTORY
@@ -188,7 +356,7 @@ class InventoryCollection(Resource):
     @api.doc("create_inventory")
     @api.response(400, "The posted data was not valid")
     @api.expect(inventory_model)
-    @api.marshal_with(inventory_model, code=201)
+    @api.response(201, "Created", inventory_model)
     def post(self):
         """
         Creates a product into the inventory
@@ -198,12 +366,173 @@ class InventoryCollection(Resource):
         product = Inventory()
         app.logger.debug("Payload = %s", api.payload)
         product.deserialize(api.payload)
-        if Inventory.find(product.id) is not None:
+        created = product.insert_new()
+        if created is None:
             abort(status.HTTP_409_CONFLICT, f"Product {product.id} already exists")
-        product.create()
+        product = created
         app.logger.info("Product with ID [%s] created.", product.id)
         location_url = api.url_for(InventoryResource, iid=product.id, _external=True)
-        return product.serialize(), status.HTTP_201_CREATED, {"Location": location_url}
+        return json_response(
+            row_encoder.dumps(product.serialize()),
+            status.HTTP_201_CREATED,
+            {"Location": location_url},
+        )
+
+
+######################################################################
+#  PATH: /inventory/low-stock
+######################################################################
+@api.route("/inventory/low-stock")
+class LowStockCollection(Resource):
+    """Lists the inventory items below their restock level"""
+
+    @api.doc(
+        "list_low_stock_inventory",
+        params={
+            "limit": "The most products to return, capped by the server's maximum page size",
+            "cursor": "Opaque cursor taken from the previous page's Link header",
+        },
+    )
+    @api.response(200, "Success", [inventory_model])
+    @api.response(400, "The limit or cursor was not valid")
+    def get(self):
+        """
+        Retrieves the products whose quantity is below their restock level
+
+        Products with the largest shortfall (restock_level - quantity) come
+        first. Accepts the same filters and paging as listing the inventory.
+        """
+        app.logger.info("Request to list low stock products")
+        filters = request.args.to_dict()
+        limit = page_limit(filters.pop("limit", None))
+        position = decode_cursor(filters.pop("cursor", None), "shortfall", "id")
+        after = (position["shortfall"], position["id"]) if position else None
+        products = Inventory.find_low_stock(limit + 1, after=after, **filters)
+        headers = {}
+        if len(products) > limit:
+            products = products[:limit]
+            last = products[-1]
+            headers = next_page_headers(
+                LowStockCollection,
+                limit,
+                filters,
+                shortfall=last.restock_level - last.quantity,
+                id=last.id,
+            )
+        app.logger.info("Returning %d low stock products", len(products))
+        return json_response(row_encoder.encode_rows(products), status.HTTP_200_OK, headers)
+
+
+######################################################################
+#  PATH: /inventory/stats
+######################################################################
+@api.route("/inventory/stats")
+class InventoryStatistics(Resource):
+    """Summarizes the inventory collection"""
+
+    @api.doc("inventory_stats")
+    @api.response(200, "Success", stats_model)
+    def get(self):
+        """
+        Returns the inventory totals
+
+        The totals come from counters kept up to date on every write, so the
+        cost of this request does not grow with the size of the inventory.
+        """
+        app.logger.info("Request for inventory statistics")
+        return json_response(row_encoder.dumps(InventoryStats.summary()), status.HTTP_200_OK)
+
+
+######################################################################
+#  PATH: /inventory/export
+######################################################################
+@api.route("/inventory/export")
+class InventoryExport(Resource):
+    """Streams the inventory collection"""
+
+    @api.doc("export_inventory")
+    @api.produces(["application/x-ndjson"])
+    def get(self):
+        """
+        Streams every product matching the query as newline delimited JSON
+
+        Accepts the same filters as listing the inventory. Rows are read from
+        the database in chunks and written out one product per line as they
+        arrive, so memory use does not grow with the size of the table.
+        """
+        app.logger.info("Request to export products")
+        products = Inventory.stream_by_queries(
+            chunk_size=app.config["EXPORT_CHUNK_SIZE"], **request.args
+        )
+
+        def generate():
+            count = 0
+            for product in products:
+                count += 1
+                yield row_encoder.encode_row(product) + b"\n"
+            app.logger.info("Exported %d products", count)
+
+        return Response(
+            stream_with_context(generate()), mimetype="application/x-ndjson"
+        )
+
+
+######################################################################
+#  PATH: /inventory/bulk
+######################################################################
+@api.route("/inventory/bulk")
+class InventoryBulkResource(Resource):
+    """Creates many inventory items in a single transaction"""
+
+    @api.doc("bulk_create_inventory")
+    @api.response(400, "The posted data was not a list")
+    @api.expect([inventory_model])
+    def post(self):
+        """
+        Creates a list of products
+
+        Every item is validated on its own; the ones that are valid and do not
+        already exist are written with one batched insert and one commit.
+        Returns the outcome for each item in the order it was posted.
+        """
+        app.logger.info("Request to bulk create products...")
+        check_content_type("application/json")
+        payload = request.get_json()
+        if not isinstance(payload, list):
+            abort(status.HTTP_400_BAD_REQUEST, "Request body must be a list of products")
+
+        results = []
+        valid = []
+        for data in payload:
+            try:
+                product = Inventory().deserialize(data)
+            except DataValidationError as error:
+                results.append({"id": None, "status": status.HTTP_400_BAD_REQUEST, "error": str(error)})
+                continue
+            result = {"id": product.id, "status": status.HTTP_201_CREATED}
+            results.append(result)
+            valid.append((result, product))
+
+        # one IN query finds every conflict, including duplicates within the payload
+        taken = Inventory.find_existing_ids({product.id for _, product in valid})
+        new_products = []
+        for result, product in valid:
+            if product.id in taken:
+                result["status"] = status.HTTP_409_CONFLICT
+                result["error"] = f"Product {product.id} already exists"
+                continue
+            taken.add(product.id)
+            new_products.append(product)
+        Inventory.create_many(new_products)
+
+        created = len(new_products)
+        app.logger.info("Bulk created %d of %d products", created, len(payload))
+        return {
+            "created": created,
+            "failed": len(payload) - created,
+            "results": results,
+        }, status.HTTP_200_OK
+
 
 ######################################################################
 #  PATH: /inventory/{id}/restock
@@ -216,31 +545,194 @@ class PurchaseResource(Resource):
     """Restock actions on an item"""
     @api.doc("Restock_inventory")
     @api.response(404, "Inventory not found")
+    @api.response(412, "The ETag in If-Match is not the current version")
     def put(self, iid):
         """Restocks product with certain id by count or up to level + count"""
         app.logger.info("Request to restock product with id %s...", iid)
-        ans = Inventory.find(iid)
+        key = item_key(iid)
+        versions = conditional.if_match_versions(request.headers.get("If-Match"))
+        ans = Inventory.restock(key, versions)
         if ans is None:
+            if versions is not None:
+                precondition_failed(key, Inventory.find(key))
             abort(status.HTTP_404_NOT_FOUND, f"Product {iid} does not exist")
-        cur = ans.quantity
-        need = ans.restock_level
-        added = 0
-        if cur < need:
-            added = need - cur
-        else:
-            added = ans.restock_count
-        ans.quantity += added
-        # ans.restock_count = added
-        ans.last_restock_date = datetime.today()
-        app.logger.info("Restock %d units of product %d", added, need)
-        ans.update()
-        return ans.serialize(), status.HTTP_200_OK
+        app.logger.info("Restock %d units of product %s", ans.last_restock_amount, iid)
+        return json_response(
+            row_encoder.dumps(ans.serialize()),
+            status.HTTP_200_OK,
+            {"ETag": quote_etag(item_etag(ans))},
+        )
+
+
+######################################################################
+#  PATH: /inventory/restock
+######################################################################
+@api.route("/inventory/restock")
+class PurchaseCollection(Resource):
+    """Restock actions on many items at once"""
+
+    @api.doc("restock_inventory_collection")
+    @api.response(400, "No ids or filters, or too many ids, were given")
+    def post(self):
+        """
+        Restocks every product matching a list of ids and/or query filters
+
+        Ids are posted as {"ids": [...]} and filters use the same query string
+        as listing the inventory, e.g. ?condition=NEW. All matching products are
+        restocked with one statement, so at most IN_CLAUSE_BATCH_SIZE ids are
+        accepted per request.
+        """
+        app.logger.info("Request to restock products in bulk...")
+        criteria = Inventory.query_criteria(**request.args)
+        if request.content_length:
+            check_content_type("application/json")
+            body = request.get_json()
+            ids = body.get("ids") if isinstance(body, dict) else None
+            if not isinstance(ids, list) or not all(isinstance(iid, int) for iid in ids):
+                abort(status.HTTP_400_BAD_REQUEST, "Request body must be {\"ids\": [<int>, ...]}")
+            if len(ids) > IN_CLAUSE_BATCH_SIZE:
+                abort(status.HTTP_400_BAD_REQUEST, f"At most {IN_CLAUSE_BATCH_SIZE} ids can be restocked at once")
+            criteria.append(Inventory.id.in_(ids))
+        if not criteria:
+            abort(status.HTTP_400_BAD_REQUEST, "Restocking needs a list of ids or query filters")
+
+        products = sorted(Inventory.restock_where(*criteria), key=lambda product: product.id)
+        results = [
+            {"id": product.id, "added": product.last_restock_amount, "quantity": product.quantity}
+            for product in products
+        ]
+        total = sum(result["added"] for result in results)
+        app.logger.info("Restocked %d units over %d products", total, len(results))
+        return {
+            "restocked": len(results),
+            "total_added": total,
+            "results": results,
+        }, status.HTTP_200_OK
 
 
 ######################################################################
 #  U T I L I T Y   F U N C T I O N S
 ######################################################################
 
+def stored_id(iid):
+    """Returns an item id from the URL as an integer, or None when no Product can have it
+
+    Ids are stored in an INTEGER column, so a number outside its range is
+    never found; it is not sent to the database either, whose drivers fail
+    on numbers beyond 64 bits.
+    """
+    try:
+        key = int(iid)
+    except ValueError:
+        return None
+    return key if MIN_INTEGER <= key <= MAX_INTEGER else None
+
+
+def item_key(iid):
+    """Converts an item id from the URL into the integer used as cache key"""
+    key = stored_id(iid)
+    if key is None:
+        abort(status.HTTP_404_NOT_FOUND, f"Product {iid} does not exist")
+    return key
+
+
+def parse_fields(value):
+    """Parses the fields query parameter into a tuple of API field names
+
+    The names come back in API order with id always included, or None when
+    the parameter is absent and every field should be returned.
+    """
+    if value is None:
+        return None
+    requested = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = requested.difference(API_FIELDS)
+    if unknown:
+        abort(status.HTTP_400_BAD_REQUEST, f"Unknown fields: {', '.join(sorted(unknown))}")
+    requested.add("id")
+    return tuple(name for name in API_FIELDS if name in requested)
+
+
+def get_item_fields(key, field_names):
+    """Returns the response for a product narrowed to some of its fields
+
+    Only those columns are read, so the item cache, which holds whole
+    products, is bypassed. The ETag names the fields as well as the version
+    because each selection is a different representation.
+    """
+    row = Inventory.find_fields(key, field_names)
+    if row is None:
+        abort(status.HTTP_404_NOT_FOUND, f"Product {key} does not exist")
+    etag = f"{item_etag(row)}-{'.'.join(field_names)}"
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+    product = row_encoder.to_dicts([row])[0]
+    del product["version"], product["updated_at"]
+    return json_response(row_encoder.dumps(product), status.HTTP_200_OK, {"ETag": quote_etag(etag)})
+
+
+def upsert_product(product):
+    """Returns the response of a PUT that creates the product if it is missing"""
+    product = product.upsert()
+    headers = {"ETag": quote_etag(item_etag(product))}
+    code = status.HTTP_200_OK
+    if product.version == 1:
+        code = status.HTTP_201_CREATED
+        headers["Location"] = api.url_for(InventoryResource, iid=product.id, _external=True)
+    app.logger.info("Product with ID [%s] upserted.", product.id)
+    return json_response(row_encoder.dumps(product.serialize()), code, headers)
+
+
+def page_limit(limit):
+    """Parses the limit query parameter and caps it at the maximum page size"""
+    max_size = app.config["MAX_PAGE_SIZE"]
+    if limit is None:
+        return max_size
+    try:
+        limit = int(limit)
+    except ValueError:
+        abort(status.HTTP_400_BAD_REQUEST, "limit must be an integer")
+    if limit < 1:
+        abort(status.HTTP_400_BAD_REQUEST, "limit must be at least 1")
+    return min(limit, max_size)
+
+
+def encode_cursor(**position):
+    """Turns the sort key of the last item on a page into an opaque cursor"""
+    token = json.dumps(position).encode("utf-8")
+    return base64.urlsafe_b64encode(token).decode("ascii")
+
+
+def decode_cursor(cursor, *keys):
+    """Returns the sort key stored in a cursor, or None when there is no cursor
+
+    Args:
+        cursor (string): the cursor from the query string
+        keys: the names of the integer values the cursor must hold
+    """
+    if cursor is None:
+        return None
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        position = {key: position[key] for key in keys}
+    except (ValueError, TypeError, KeyError, UnicodeError) as error:
+        abort(status.HTTP_400_BAD_REQUEST, f"Invalid cursor: {error}")
+    if not all(isinstance(value, int) for value in position.values()):
+        abort(status.HTTP_400_BAD_REQUEST, "Invalid cursor")
+    return position
+
+
+def next_page_headers(resource, limit, filters, **position):
+    """Returns the Link header that points to the page after position"""
+    next_url = api.url_for(
+        resource,
+        limit=limit,
+        cursor=encode_cursor(**position),
+        _external=True,
+        **filters,
+    )
+    return {"Link": f'<{next_url}>; rel="next"'}
+
+
 def check_content_type(content_type):
     """Checks that the media type is correct"""
     if "Content-Type" not in request.headers:
@@ -0,0 +1,270 @@
+"""
+Inventory Statistics
+
+The inventory_stats table of summary counters and the triggers that keep it
+up to date with every write to the inventory table, so the stats endpoint
+reads a few counter rows instead of the whole inventory.
+"""
+import logging
+from sqlalchemy import event
+from service.models import db, Condition, Inventory
+
+logger = logging.getLogger("flask.app")
+
+# Counter rows per Condition in inventory_stats, spreading concurrent writers
+STATS_SLOTS = 16
+
+
+class InventoryStats(db.Model):
+    """
+    Class that represents the summary counters of the inventory
+
+    Each Condition has STATS_SLOTS rows and a Product counts towards slot
+    abs(id) % STATS_SLOTS, so concurrent writes to different Products rarely
+    wait on the same counter row. Triggers on the inventory table keep the
+    counters right inside the transaction of every insert, update and delete,
+    including the set based UPDATE statements that bypass the ORM.
+    """
+
+    __tablename__ = "inventory_stats"
+
+    condition = db.Column(Inventory.__table__.c.condition.type, primary_key=True)
+    slot = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    products = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.BigInteger, nullable=False, default=0)
+    below_restock = db.Column(db.Integer, nullable=False, default=0)
+
+    @classmethod
+    def summary(cls) -> dict:
+        """Returns the inventory totals from the counters
+
+        This reads the few counter rows plus max(last_restock_date), which
+        the database answers from ix_inventory_last_restock_date, so the cost
+        does not grow with the number of Products.
+        """
+        statement = db.select(
+            cls.condition,
+            db.func.sum(cls.products),
+            db.func.sum(cls.units),
+            db.func.sum(cls.below_restock),
+        ).group_by(cls.condition)
+        conditions = {condition.name: {"items": 0, "units": 0} for condition in Condition}
+        below_restock = 0
+        for condition, products, units, below in db.session.execute(statement).all():
+            conditions[condition.name] = {"items": int(products), "units": int(units)}
+            below_restock += int(below)
+        last_restock_date = db.session.execute(
+            db.select(db.func.max(Inventory.last_restock_date))
+        ).scalar()
+        return {
+            "items": sum(totals["items"] for totals in conditions.values()),
+            "units": sum(totals["units"] for totals in conditions.values()),
+            "below_restock_level": below_restock,
+            "last_restock_date": last_restock_date,
+            "conditions": conditions,
+        }
+
+    @classmethod
+    def counters(cls, connection) -> dict:
+        """Returns the stored counters as {(condition, slot): (products, units, below_restock)}"""
+        table = cls.__table__
+        rows = connection.execute(
+            db.select(table.c.condition, table.c.slot, table.c.products, table.c.units, table.c.below_restock)
+        )
+        return {(row[0], row[1]): tuple(row[2:]) for row in rows}
+
+    @classmethod
+    def recount(cls, connection) -> dict:
+        """Counts the inventory table from scratch, in the form of counters()"""
+        table = Inventory.__table__
+        slot = (db.func.abs(table.c.id) % STATS_SLOTS).label("slot")
+        statement = db.select(
+            table.c.condition,
+            slot,
+            db.func.count(),
+            db.func.sum(table.c.quantity),
+            db.func.sum(db.case((table.c.quantity < table.c.restock_level, 1), else_=0)),
+        ).group_by(table.c.condition, slot)
+        counts = {
+            (condition, number): (0, 0, 0)
+            for condition in Condition
+            for number in range(STATS_SLOTS)
+        }
+        for condition, number, products, units, below in connection.execute(statement):
+            counts[(condition, number)] = (products, int(units), int(below))
+        return counts
+
+    @classmethod
+    def rebuild(cls, connection):
+        """Replaces the counters with a fresh count of the inventory table
+
+        On PostgreSQL writes to the inventory table wait until the
+        transaction of connection ends, so none of them is counted twice.
+        """
+        lock_inventory(connection)
+        counts = cls.recount(connection)
+        logger.info("Rebuilding inventory statistics for %d products", sum(c[0] for c in counts.values()))
+        connection.execute(db.delete(cls.__table__))
+        connection.execute(
+            db.insert(cls.__table__),
+            [
+                {
+                    "condition": condition,
+                    "slot": slot,
+                    "products": products,
+                    "units": units,
+                    "below_restock": below,
+                }
+                for (condition, slot), (products, units, below) in counts.items()
+            ],
+        )
+
+    @classmethod
+    def verify(cls, connection) -> list:
+        """Returns the (condition, slot) keys whose counters differ from a fresh count"""
+        lock_inventory(connection)
+        counters = cls.counters(connection)
+        return sorted(
+            (key for key, counts in cls.recount(connection).items() if counters.get(key) != counts),
+            key=lambda key: (key[0].value, key[1]),
+        )
+
+
+def unless_trigger(name, statement) -> str:
+    """Returns a PostgreSQL statement that runs statement when inventory has no trigger name
+
+    CREATE TRIGGER and DROP TRIGGER lock the table against reads and writes,
+    so they are only run when the trigger is missing.
+    """
+    return f"""
+        DO $$ BEGIN
+            IF NOT EXISTS (SELECT FROM pg_trigger WHERE tgrelid = 'inventory'::regclass
+                           AND tgname = '{name}') THEN
+                {statement};
+            END IF;
+        END $$
+        """
+
+
+# Keep inventory_stats up to date; NEW.quantity < NEW.restock_level is 0 or 1. On PostgreSQL the
+# triggers run once per statement and apply its deltas in (condition, slot)
+# order, so multi-row writes lock the counter rows in the same order.
+STATS_TRIGGERS = {
+    "sqlite": [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS inventory_stats_insert AFTER INSERT ON inventory
+        BEGIN
+            UPDATE inventory_stats
+            SET products = products + 1, units = units + NEW.quantity,
+                below_restock = below_restock + (NEW.quantity < NEW.restock_level)
+            WHERE condition = NEW.condition AND slot = abs(NEW.id) % {STATS_SLOTS};
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS inventory_stats_delete AFTER DELETE ON inventory
+        BEGIN
+            UPDATE inventory_stats
+            SET products = products - 1, units = units - OLD.quantity,
+                below_restock = below_restock - (OLD.quantity < OLD.restock_level)
+            WHERE condition = OLD.condition AND slot = abs(OLD.id) % {STATS_SLOTS};
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS inventory_stats_update
+        AFTER UPDATE OF id, quantity, restock_level, condition ON inventory
+        BEGIN
+            UPDATE inventory_stats
+            SET products = products - 1, units = units - OLD.quantity,
+                below_restock = below_restock - (OLD.quantity < OLD.restock_level)
+            WHERE condition = OLD.condition AND slot = abs(OLD.id) % {STATS_SLOTS};
+            UPDATE inventory_stats
+            SET products = products + 1, units = units + NEW.quantity,
+                below_restock = below_restock + (NEW.quantity < NEW.restock_level)
+            WHERE condition = NEW.condition AND slot = abs(NEW.id) % {STATS_SLOTS};
+        END
+        """,
+    ],
+    "postgresql": [
+        f"""
+        CREATE OR REPLACE FUNCTION inventory_stats_apply() RETURNS trigger AS $$
+        DECLARE
+            changes text[] := ARRAY[]::text[];
+            delta record;
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                changes := changes || 'SELECT condition, id, -1 AS products, -quantity AS units,
+                    -(quantity < restock_level)::int AS below_restock FROM old_rows'::text;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                changes := changes || 'SELECT condition, id, 1 AS products, quantity AS units,
+                    (quantity < restock_level)::int AS below_restock FROM new_rows'::text;
+            END IF;
+            FOR delta IN EXECUTE
+                'SELECT condition, mod(abs(id), {STATS_SLOTS}) AS slot, sum(products) AS products,
+                    sum(units) AS units, sum(below_restock) AS below_restock
+                FROM (' || array_to_string(changes, ' UNION ALL ') || ') AS changes
+                GROUP BY 1, 2
+                HAVING sum(products) <> 0 OR sum(units) <> 0 OR sum(below_restock) <> 0
+                ORDER BY 1, 2'
+            LOOP
+                UPDATE inventory_stats
+                SET products = products + delta.products, units = units + delta.units,
+                    below_restock = below_restock + delta.below_restock
+                WHERE condition = delta.condition AND slot = delta.slot;
+            END LOOP;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        DO $$ BEGIN
+            IF EXISTS (SELECT FROM pg_trigger WHERE tgrelid = 'inventory'::regclass
+                       AND tgname = 'inventory_stats_apply') THEN
+                DROP TRIGGER inventory_stats_apply ON inventory;
+            END IF;
+        END $$
+        """,
+        unless_trigger(
+            "inventory_stats_insert",
+            """CREATE TRIGGER inventory_stats_insert AFTER INSERT ON inventory
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION inventory_stats_apply()""",
+        ),
+        unless_trigger(
+            "inventory_stats_update",
+            """CREATE TRIGGER inventory_stats_update AFTER UPDATE ON inventory
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION inventory_stats_apply()""",
+        ),
+        unless_trigger(
+            "inventory_stats_delete",
+            """CREATE TRIGGER inventory_stats_delete AFTER DELETE ON inventory
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION inventory_stats_apply()""",
+        ),
+    ],
+}
+
+
+@event.listens_for(db.metadata, "after_create")
+def install_stats_triggers(target, connection, **kw):  # pylint: disable=unused-argument
+    """Creates the inventory_stats triggers, filling the counters if they are empty
+
+    Runs after every create_all() and is safe to repeat: triggers that
+    already exist are left alone, so the table is not locked again.
+    """
+    statements = STATS_TRIGGERS.get(connection.dialect.name)
+    if statements is None:
+        logger.warning("No inventory statistics triggers for %s", connection.dialect.name)
+        return
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+    table = InventoryStats.__table__
+    if not connection.execute(db.select(db.func.count()).select_from(table)).scalar():
+        InventoryStats.rebuild(connection)
+
+
+def lock_inventory(connection):
+    """Blocks writes to the inventory table until the transaction ends (PostgreSQL only)"""
+    if connection.dialect.name == "postgresql":
+        connection.exec_driver_sql("LOCK TABLE inventory IN SHARE MODE")
@@ -0,0 +1,103 @@
+"""
+Test cases for the Item Cache
+
+"""
+from unittest import TestCase
+from unittest.mock import patch
+from service.common.cache import ItemCache, StatementCache
+
+
+######################################################################
+#  I T E M   C A C H E   T E S T   C A S E S
+######################################################################
+class TestItemCache(TestCase):
+    """Test Cases for ItemCache"""
+
+    def test_get_and_put(self):
+        """It should return stored values and count hits and misses"""
+        cache = ItemCache(maxsize=10, ttl=60)
+        self.assertIsNone(cache.get(1))
+        cache.put(1, {"id": 1})
+        self.assertEqual(cache.get(1), {"id": 1})
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hit_rate"], 0.5)
+        self.assertEqual(stats["size"], 1)
+
+    def test_lru_eviction(self):
+        """It should evict the least recently used entry when full"""
+        cache = ItemCache(maxsize=2, ttl=60)
+        cache.put(1, "one")
+        cache.put(2, "two")
+        cache.get(1)
+        cache.put(3, "three")
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.get(1), "one")
+        self.assertEqual(cache.get(3), "three")
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_ttl_expiry(self):
+        """It should not return entries older than the ttl"""
+        cache = ItemCache(maxsize=2, ttl=5)
+        with patch("service.common.cache.time.monotonic", return_value=100.0):
+            cache.put(1, "one")
+        with patch("service.common.cache.time.monotonic", return_value=104.0):
+            self.assertEqual(cache.get(1), "one")
+        with patch("service.common.cache.time.monotonic", return_value=106.0):
+            self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_invalidate(self):
+        """It should drop invalidated keys and stale loads"""
+        cache = ItemCache(maxsize=10, ttl=60)
+        cache.put(1, "one")
+        generation = cache.generation()
+        cache.invalidate(1, 2)
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.stats()["invalidations"], 1)
+        cache.put(1, "stale", generation)
+        self.assertIsNone(cache.get(1))
+        cache.put(1, "fresh", cache.generation())
+        self.assertEqual(cache.get(1), "fresh")
+        cache.clear()
+        self.assertIsNone(cache.get(1))
+
+    def test_disabled(self):
+        """It should store nothing when the size is zero"""
+        cache = ItemCache(maxsize=0, ttl=60)
+        cache.put(1, "one")
+        self.assertIsNone(cache.get(1))
+
+
+######################################################################
+#  S T A T E M E N T   C A C H E   T E S T   C A S E S
+######################################################################
+class TestStatementCache(TestCase):
+    """Test Cases for StatementCache"""
+
+    def test_get_or_build(self):
+        """It should build a statement once per key"""
+        cache = StatementCache(maxsize=10)
+        built = []
+
+        def build():
+            built.append(1)
+            return f"statement {len(built)}"
+
+        self.assertEqual(cache.get_or_build("a", build), "statement 1")
+        self.assertEqual(cache.get_or_build("a", build), "statement 1")
+        self.assertEqual(cache.get_or_build("b", build), "statement 2")
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]), (1, 2, 2))
+        self.assertAlmostEqual(stats["hit_rate"], 1 / 3)
+
+    def test_lru_eviction(self):
+        """It should evict the least recently used statement when full"""
+        cache = StatementCache(maxsize=1)
+        cache.get_or_build("a", lambda: "a")
+        cache.get_or_build("b", lambda: "b")
+        self.assertEqual(cache.get_or_build("a", lambda: "rebuilt"), "rebuilt")
+        self.assertEqual(cache.stats()["evictions"], 2)
+        cache.clear()
+        self.assertEqual(cache.stats()["size"], 0)
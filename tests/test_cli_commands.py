@@ -1,16 +1,36 @@
 """
 CLI Command Extensions for Flask
 """
+import csv
+import gzip
+import json
 import os
+import tempfile
+from datetime import date
 from unittest import TestCase
 from unittest.mock import patch, MagicMock
 from click.testing import CliRunner
-from service.common.cli_commands import db_create
+from sqlalchemy import MetaData, Table, inspect
+from service.common.cli_commands import (
+    db_create,
+    db_indexes,
+    db_init,
+    db_stats,
+    inventory_export,
+    inventory_import,
+)
+from service.models import db, Inventory, Condition, invalid_indexes
+from service.stats import InventoryStats
 
 
 class TestFlaskCLI(TestCase):
     """Test Flask CLI Commands"""
 
+    @classmethod
+    def setUpClass(cls):
+        """The service no longer creates its tables when it is imported"""
+        Inventory.create_schema()
+
     def setUp(self):
         self.runner = CliRunner()
 
@@ -21,3 +41,158 @@ class TestFlaskCLI(TestCase):
         with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
             result = self.runner.invoke(db_create)
             self.assertEqual(result.exit_code, 0)
+
+    def test_db_init(self):
+        """It should create the schema when asked, not when the service is imported"""
+        # inventory_stats shares the condition type with inventory on PostgreSQL
+        db.metadata.drop_all(db.engine, tables=[InventoryStats.__table__, Inventory.__table__])
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(db_init)
+            self.assertEqual(result.exit_code, 0)
+        self.assertIn("up to date", result.output)
+        self.assertTrue(inspect(db.engine).has_table("inventory"))
+
+    def test_db_init_adds_columns(self):
+        """It should add the columns a table from an older release lacks"""
+        added = ("last_restock_amount", "updated_at", "version")
+        db.metadata.drop_all(db.engine, tables=[InventoryStats.__table__, Inventory.__table__])
+        old_table = Table(
+            "inventory",
+            MetaData(),
+            *(column.copy() for column in Inventory.__table__.columns if column.name not in added),
+        )
+        old_table.create(db.engine)
+        with db.engine.begin() as connection:
+            connection.execute(old_table.insert().values(id=1, name="old", quantity=3, condition="USED"))
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            for _ in range(2):
+                result = self.runner.invoke(db_init)
+                self.assertEqual(result.exit_code, 0)
+        names = {column["name"] for column in inspect(db.engine).get_columns("inventory")}
+        self.assertTrue(names.issuperset(added))
+        product = Inventory.find(1)
+        self.assertEqual(product.version, 1)
+        self.assertEqual(product.last_restock_amount, 0)
+        self.assertIsNotNone(product.updated_at)
+        self.assertEqual(InventoryStats.summary()["items"], 1)
+        # the old table had none of the secondary indexes
+        db.session.rollback()
+        db.metadata.drop_all(db.engine, tables=[InventoryStats.__table__, Inventory.__table__])
+        Inventory.create_schema()
+
+    def test_db_indexes(self):
+        """It should create the missing secondary indexes"""
+        index = next(index for index in Inventory.__table__.indexes if index.name == "ix_inventory_name")
+        index.drop(db.engine)
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(db_indexes)
+            self.assertEqual(result.exit_code, 0)
+        for index in Inventory.__table__.indexes:
+            if index.name == "ix_inventory_name_pattern" and db.engine.dialect.name != "postgresql":
+                self.assertNotIn(index.name, result.output)
+            else:
+                self.assertIn(index.name, result.output)
+            # CONCURRENTLY is only set on a copy of the table
+            self.assertFalse(index.dialect_options["postgresql"]["concurrently"])
+        names = {found["name"] for found in inspect(db.engine).get_indexes("inventory")}
+        self.assertIn("ix_inventory_name", names)
+
+    def test_db_stats(self):
+        """It should verify and rebuild the inventory statistics"""
+        Inventory(id=1, quantity=3).create()
+        with db.engine.begin() as connection:
+            connection.execute(db.update(InventoryStats).values(units=InventoryStats.units + 1))
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(db_stats, ["--check"])
+            self.assertEqual(result.exit_code, 1)
+            self.assertIn("do not match", result.output)
+            result = self.runner.invoke(db_stats)
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn("correct", result.output)
+        self.assertEqual(InventoryStats.summary()["units"], 3)
+        Inventory.find(1).delete()
+
+    def test_db_indexes_rebuilds_invalid(self):
+        """It should drop and rebuild an index left INVALID by a failed build"""
+        if db.engine.dialect.name != "postgresql":
+            self.skipTest("only PostgreSQL has invalid indexes")
+        mark_invalid = db.text(
+            "UPDATE pg_index SET indisvalid = false WHERE indexrelid = 'ix_inventory_name'::regclass"
+        )
+        with db.engine.begin() as connection:
+            connection.execute(mark_invalid)
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(db_indexes)
+            self.assertEqual(result.exit_code, 0)
+        with db.engine.connect() as connection:
+            self.assertEqual(invalid_indexes(connection), set())
+
+    def test_inventory_import(self):
+        """It should upsert the valid rows of a feed and write the rest to a rejects file"""
+        db.session.query(Inventory).delete()
+        Inventory(id=1, name="old", quantity=1).create()
+        header = "id,name,quantity,restock_level,restock_count,condition,first_entry_date,last_restock_date"
+        rows = [
+            "1,hammer,5,2,10,USED,2020-01-01,2023-05-01",
+            "2,,7,1,3,NEW,2021-02-03,2023-06-01",
+            "3,saw,x,1,3,NEW,2021-02-03,2023-06-01",
+            "4,drill,1,1,3,BROKEN,2021-02-03,2023-06-01",
+            "5,file,1,1,3,NEW,2021-02-03,",
+            "2,wrench,8,1,3,OPEN_BOX,2021-02-03,2023-06-01",
+        ]
+        with tempfile.TemporaryDirectory() as folder:
+            feed = os.path.join(folder, "feed.csv")
+            with open(feed, "w", encoding="utf-8") as file:
+                file.write("\n".join([header] + rows) + "\n")
+            with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+                result = self.runner.invoke(inventory_import, [feed, "--batch-size", "2"])
+            self.assertEqual(result.exit_code, 0, result.output)
+            self.assertIn("Imported 2 products", result.output)
+            self.assertIn("Rejected 3 rows", result.output)
+            with open(f"{feed}.rejects.csv", encoding="utf-8") as file:
+                rejects = list(csv.DictReader(file))
+        self.assertEqual([reject["line"] for reject in rejects], ["4", "5", "6"])
+        self.assertEqual([reject["id"] for reject in rejects], ["3", "4", "5"])
+        self.assertTrue(all(reject["error"].startswith("Invalid Product") for reject in rejects))
+
+        db.session.expire_all()
+        hammer = Inventory.find(1)
+        self.assertEqual((hammer.name, hammer.quantity, hammer.version), ("hammer", 5, 2))
+        self.assertEqual(hammer.last_restock_date, date(2023, 5, 1))
+        wrench = Inventory.find(2)
+        self.assertEqual((wrench.name, wrench.condition, wrench.version), ("wrench", Condition.OPEN_BOX, 1))
+        self.assertEqual(len(Inventory.all()), 2)
+        with db.engine.connect() as connection:
+            self.assertEqual(InventoryStats.verify(connection), [])
+        db.session.query(Inventory).delete()
+        db.session.commit()
+
+    def test_inventory_export(self):
+        """It should export the inventory to compressed shards and a manifest"""
+        db.session.query(Inventory).delete()
+        Inventory.create_many(
+            [Inventory(id=iid, name=f"item {iid}", quantity=iid, condition=Condition.USED) for iid in range(1, 26)]
+        )
+        for fmt in ("jsonl", "csv"):
+            with tempfile.TemporaryDirectory() as folder:
+                with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+                    result = self.runner.invoke(inventory_export, [folder, "--format", fmt, "--shard-size", "10"])
+                self.assertEqual(result.exit_code, 0, result.output)
+                self.assertIn("Exported 25 products to 3 shards", result.output)
+                with open(os.path.join(folder, "manifest.json"), encoding="utf-8") as file:
+                    manifest = json.load(file)
+                self.assertEqual(manifest["rows"], 25)
+                self.assertEqual([shard["rows"] for shard in manifest["shards"]], [10, 10, 5])
+                self.assertEqual([shard["first_id"] for shard in manifest["shards"]], [1, 11, 21])
+                products = []
+                for shard in manifest["shards"]:
+                    with gzip.open(os.path.join(folder, shard["file"]), "rt", encoding="utf-8") as file:
+                        if fmt == "csv":
+                            products.extend(csv.DictReader(file))
+                        else:
+                            products.extend(json.loads(line) for line in file)
+                self.assertEqual([int(product["id"]) for product in products], list(range(1, 26)))
+                self.assertEqual(products[4]["condition"], "USED")
+                self.assertEqual(str(products[4]["quantity"]), "5")
+        db.session.query(Inventory).delete()
+        db.session.commit()
@@ -0,0 +1,66 @@
+"""
+Test cases for the Row Encoder
+
+"""
+import json
+from collections import namedtuple
+from datetime import date
+from unittest import TestCase
+from service.common.encoder import RowEncoder, orjson
+from service.models import Condition
+
+Row = namedtuple("Row", ["id", "condition", "last_restock_date"])
+
+
+######################################################################
+#  R O W   E N C O D E R   T E S T   C A S E S
+######################################################################
+class TestRowEncoder(TestCase):
+    """Test Cases for RowEncoder"""
+
+    def setUp(self):
+        self.rows = [
+            Row(1, Condition.NEW, date(2023, 5, 1)),
+            Row(2, Condition.USED, None),
+        ]
+        self.expected = [
+            {"id": 1, "condition": "NEW", "last_restock_date": "2023-05-01"},
+            {"id": 2, "condition": "USED", "last_restock_date": None},
+        ]
+
+    def encoder(self, use_orjson):
+        """Returns an encoder for the test rows"""
+        return RowEncoder(
+            enum_fields=("condition",),
+            date_fields=("last_restock_date",),
+            use_orjson=use_orjson,
+        )
+
+    def test_encode_rows_with_json(self):
+        """It should encode rows with the standard library"""
+        encoder = self.encoder(use_orjson=False)
+        self.assertFalse(encoder.use_orjson)
+        body = encoder.encode_rows(self.rows)
+        self.assertIsInstance(body, bytes)
+        self.assertEqual(json.loads(body), self.expected)
+
+    def test_encode_rows_with_orjson(self):
+        """It should encode rows with orjson when it is installed"""
+        if orjson is None:
+            self.skipTest("orjson is not installed")
+        encoder = self.encoder(use_orjson=True)
+        self.assertTrue(encoder.use_orjson)
+        self.assertEqual(json.loads(encoder.encode_rows(self.rows)), self.expected)
+
+    def test_encode_row(self):
+        """It should encode a single row as an object"""
+        encoder = self.encoder(use_orjson=False)
+        self.assertEqual(json.loads(encoder.encode_row(self.rows[0])), self.expected[0])
+
+    def test_encode_no_rows(self):
+        """It should encode an empty list"""
+        self.assertEqual(self.encoder(use_orjson=False).encode_rows([]), b"[]")
+
+    def test_dumps_bad_value(self):
+        """It should not encode values it does not know"""
+        self.assertRaises(TypeError, self.encoder(use_orjson=False).dumps, {"x": object()})
@@ -0,0 +1,50 @@
+"""
+Test cases for the Timed Queue Pool
+
+"""
+import sqlite3
+from unittest import TestCase
+from sqlalchemy import exc
+from service.common.pool import TimedQueuePool
+
+
+######################################################################
+#  T I M E D   Q U E U E   P O O L   T E S T   C A S E S
+######################################################################
+class TestTimedQueuePool(TestCase):
+    """Test Cases for TimedQueuePool"""
+
+    def setUp(self):
+        self.pool = TimedQueuePool(
+            lambda: sqlite3.connect(":memory:"), pool_size=1, max_overflow=0, timeout=0.05
+        )
+
+    def tearDown(self):
+        self.pool.dispose()
+
+    def test_checkout_counters(self):
+        """It should count checkouts and show what is checked out"""
+        connection = self.pool.connect()
+        stats = self.pool.stats()
+        self.assertEqual(stats["checkouts"], 1)
+        self.assertEqual(stats["checked_out"], 1)
+        self.assertEqual(stats["size"], 1)
+        connection.close()
+        stats = self.pool.stats()
+        self.assertEqual(stats["checked_out"], 0)
+        self.assertEqual(stats["checked_in"], 1)
+
+    def test_timeout_wait(self):
+        """It should time checkouts that wait for an exhausted pool"""
+        connection = self.pool.connect()
+        self.assertRaises(exc.TimeoutError, self.pool.connect)
+        stats = self.pool.stats()
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertEqual(stats["checkouts"], 2)
+        self.assertGreaterEqual(stats["wait_time_max"], 0.05)
+        self.assertGreaterEqual(stats["wait_time_total"], stats["wait_time_max"])
+        connection.close()
+
+    def test_recreate(self):
+        """It should keep its class when the pool is recreated"""
+        self.assertIsInstance(self.pool.recreate(), TimedQueuePool)
@@ -6,12 +6,16 @@ Test cases can be run with the following:
   coverage report -m
 """
 import os
+import json
 import logging
 from unittest import TestCase
+from unittest.mock import patch
 from datetime import datetime
+from sqlalchemy import exc
 from service import app
-from service.models import db, init_db, Inventory
+from service.models import db, init_db, Inventory, Condition
 from service.common import status  # HTTP Status Codes
+from service.common.cache import item_cache
 from tests.factories import ProductFactory
 
 DATABASE_URI = os.getenv(
@@ -36,6 +40,7 @@ class TestYourResourceServer(TestCase):
         app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URI
         app.logger.setLevel(logging.CRITICAL)
         init_db(app)
+        Inventory.create_schema()
 
     @classmethod
     def tearDownClass(cls):
@@ -47,6 +52,7 @@ class TestYourResourceServer(TestCase):
         self.client = app.test_client()
         db.session.query(Inventory).delete()  # clean up the last tests
         db.session.commit()
+        item_cache.clear()
 
     def tearDown(self):
         """This runs after each test"""
@@ -146,6 +152,18 @@ class TestYourResourceServer(TestCase):
         )
         self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
 
+    def test_create_product_without_id(self):
+        """It should not Create a product whose id is null or not an integer"""
+        test_product = ProductFactory(id=5)
+        test_product.create()
+        data = dict(ProductFactory().serialize(), id=None)
+        response = self.client.post(BASE_URL, json=data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.get_json()["message"], "Invalid Product: id must be an integer")
+        response = self.client.post(BASE_URL, json=dict(data, id="abc"))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(Inventory.all()), 1)
+
     def test_create_bad_data(self):
         """Create an item with bad data, missing fields or wrong types, should raise error 400"""
         not_integer = {
@@ -174,6 +192,85 @@ class TestYourResourceServer(TestCase):
         )
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_bulk_create_products(self):
+        """It should Create many products and report each one"""
+        existing = ProductFactory(id=1)
+        existing.create()
+        items = [ProductFactory(id=i).serialize() for i in range(1, 5)]
+        items.append(items[1])  # duplicate within the payload
+        items.append({"id": 9, "quantity": 1})  # missing fields
+        response = self.client.post(f"{BASE_URL}/bulk", json=items)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(data["created"], 3)
+        self.assertEqual(data["failed"], 3)
+        codes = [result["status"] for result in data["results"]]
+        self.assertEqual(
+            codes,
+            [
+                status.HTTP_409_CONFLICT,
+                status.HTTP_201_CREATED,
+                status.HTTP_201_CREATED,
+                status.HTTP_201_CREATED,
+                status.HTTP_409_CONFLICT,
+                status.HTTP_400_BAD_REQUEST,
+            ],
+        )
+        self.assertEqual(len(Inventory.all()), 4)
+        response = self.client.get(f"{BASE_URL}/3")
+        self.assertEqual(response.get_json()["name"], items[2]["name"])
+
+    def test_bulk_create_bad_ids(self):
+        """It should reject only the bulk items whose id is not an integer"""
+        items = [ProductFactory(id=1).serialize() for _ in range(6)]
+        for item, iid in zip(items[1:], [None, "abc", 2.5, [3], True]):
+            item["id"] = iid
+        items.append(dict(items[0], id="1"))  # the same id as a string
+        response = self.client.post(f"{BASE_URL}/bulk", json=items)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(data["created"], 1)
+        self.assertEqual(data["failed"], 6)
+        codes = [result["status"] for result in data["results"]]
+        self.assertEqual(
+            codes, [status.HTTP_201_CREATED] + [status.HTTP_400_BAD_REQUEST] * 5 + [status.HTTP_409_CONFLICT]
+        )
+        self.assertEqual([product.id for product in Inventory.all()], [1])
+
+    def test_bulk_create_bad_fields(self):
+        """It should reject only the bulk items with a field the database cannot store"""
+        items = [ProductFactory(id=i).serialize() for i in range(1, 7)]
+        items[1]["quantity"] = "abc"
+        items[2]["restock_level"] = 2**31
+        items[3]["name"] = "x" * 64
+        items[4]["condition"] = "BROKEN"
+        items[5]["restock_count"] = "7"  # as the HTML form sends it
+        response = self.client.post(f"{BASE_URL}/bulk", json=items)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(data["created"], 2)
+        errors = [result.get("error") for result in data["results"]]
+        self.assertEqual(
+            errors,
+            [
+                None,
+                "Invalid Product: quantity must be an integer",
+                "Invalid Product: restock_level is out of range",
+                "Invalid Product: name must be text of at most 63 characters",
+                "Invalid Product: condition must be one of NEW, OPEN_BOX, USED",
+                None,
+            ],
+        )
+        self.assertEqual([product.id for product in Inventory.all()], [1, 6])
+        self.assertEqual(Inventory.find(6).restock_count, 7)
+
+    def test_bulk_create_bad_request(self):
+        """It should not Create products in bulk from a body that is not a list"""
+        response = self.client.post(f"{BASE_URL}/bulk", json={"id": 1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(f"{BASE_URL}/bulk", data="[]", content_type="text/plain")
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
     def test_get_product(self):
         """Get a product from db, should return the item with id or 404 if not exist"""
         test_item = ProductFactory()
@@ -201,6 +298,165 @@ class TestYourResourceServer(TestCase):
         response = self.client.get(f"{BASE_URL}/{iid}", content_type="application/json")
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+    def test_product_id_out_of_range(self):
+        """It should answer 404 for ids no product can have, and 204 when deleting them"""
+        for iid in ("99999999999999999999", "-99999999999999999999", str(2**31), "abc"):
+            self.assertEqual(self.client.get(f"{BASE_URL}/{iid}").status_code, status.HTTP_404_NOT_FOUND)
+            self.assertEqual(self.client.put(f"{BASE_URL}/{iid}/restock").status_code, status.HTTP_404_NOT_FOUND)
+            self.assertEqual(self.client.delete(f"{BASE_URL}/{iid}").status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_get_product_cached(self):
+        """It should serve repeated reads from the item cache until a write"""
+        Inventory(id=7, name="cached", quantity=1, restock_level=5, restock_count=2).create()
+        stats = self.client.get("/stats/cache").get_json()
+        self.assertEqual(self.client.get(f"{BASE_URL}/7").get_json()["name"], "cached")
+        self.assertEqual(self.client.get(f"{BASE_URL}/7").get_json()["name"], "cached")
+        after = self.client.get("/stats/cache").get_json()
+        self.assertEqual(after["misses"] - stats["misses"], 1)
+        self.assertEqual(after["hits"] - stats["hits"], 1)
+
+        item = self.client.get(f"{BASE_URL}/7").get_json()
+        item["name"] = "renamed"
+        self.client.put(f"{BASE_URL}/7", json=item)
+        self.assertEqual(self.client.get(f"{BASE_URL}/7").get_json()["name"], "renamed")
+        self.client.put(f"{BASE_URL}/7/restock")
+        self.assertEqual(self.client.get(f"{BASE_URL}/7").get_json()["quantity"], 5)
+        self.client.post(f"{BASE_URL}/restock", json={"ids": [7]})
+        self.assertEqual(self.client.get(f"{BASE_URL}/7").get_json()["quantity"], 7)
+        self.client.delete(f"{BASE_URL}/7")
+        self.assertEqual(self.client.get(f"{BASE_URL}/7").status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(f"{BASE_URL}/seven").status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_get_product_sparse_fields(self):
+        """It should Get only the requested fields of a product"""
+        test_product = self._create_products(1)[0]
+        url = f"{BASE_URL}/{test_product.id}"
+        resp = self.client.get(url, query_string="fields=quantity, name")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            resp.get_json(),
+            {"id": test_product.id, "name": test_product.name, "quantity": test_product.quantity},
+        )
+        etag = resp.headers["ETag"]
+        self.assertNotEqual(etag, self.client.get(url).headers["ETag"])
+        resp = self.client.get(url, query_string="fields=quantity,name", headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        resp = self.client.get(f"{BASE_URL}/0", query_string="fields=quantity")
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+        resp = self.client.get(url, query_string="fields=price")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_metrics(self):
+        """It should expose request, database and cache metrics to Prometheus"""
+        Inventory(id=1, quantity=1).create()
+        self.client.get(f"{BASE_URL}/1")
+        self.client.get(f"{BASE_URL}/1")
+        resp = self.client.get("/metrics")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertTrue(resp.content_type.startswith("text/plain"))
+        text = resp.get_data(as_text=True)
+        self.assertIn(
+            'inventory_http_requests_total{endpoint="inventory_resource",method="GET",status="200"}', text
+        )
+        self.assertIn("inventory_http_request_duration_seconds_bucket{", text)
+        self.assertIn("inventory_http_requests_in_progress 1.0", text)
+        self.assertIn('inventory_db_query_duration_seconds_count{operation="SELECT"}', text)
+        self.assertIn('inventory_cache_events_total{cache="item",event="hit"}', text)
+
+    def test_get_pool_stats(self):
+        """It should return the connection pool statistics"""
+        resp = self.client.get("/stats/pool")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertGreater(data["checkouts"], 0)
+        self.assertIn("checked_out", data)
+        self.assertIn("wait_time_max", data)
+
+    def test_server_timing(self):
+        """It should report the SQL time of a request in Server-Timing"""
+        Inventory(id=1, quantity=1).create()
+        resp = self.client.get(BASE_URL, query_string="quantity=1")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        timing = resp.headers["Server-Timing"]
+        self.assertRegex(timing, r'^db;dur=[0-9.]+;desc="[1-9][0-9]* queries"')
+        self.assertIn("db-slowest;dur=", timing)
+        self.assertIn("app;dur=", timing)
+
+    def test_slow_query_log(self):
+        """It should log slow requests and statements with their query plan"""
+        Inventory(id=1, quantity=1).create()
+        saved = {key: app.config[key] for key in ("SLOW_REQUEST_MS", "SLOW_QUERY_MS", "EXPLAIN_SAMPLE_RATE")}
+        app.config.update(SLOW_REQUEST_MS=0, SLOW_QUERY_MS=0, EXPLAIN_SAMPLE_RATE=1)
+        try:
+            with self.assertLogs("flask.app", "WARNING") as logs:
+                resp = self.client.get(BASE_URL, query_string="quantity=1")
+        finally:
+            app.config.update(saved)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        output = "\n".join(logs.output)
+        self.assertIn("Slow query", output)
+        self.assertIn("Query plan:", output)
+        self.assertIn("Slow request GET /api/inventory?quantity=1", output)
+
+    def test_get_inventory_stats(self):
+        """It should return the inventory totals"""
+        Inventory(id=1, quantity=1, restock_level=4, condition=Condition.NEW).create()
+        Inventory(id=2, quantity=6, restock_level=4, condition=Condition.USED).create()
+        resp = self.client.get(f"{BASE_URL}/stats")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual(data["items"], 2)
+        self.assertEqual(data["units"], 7)
+        self.assertEqual(data["below_restock_level"], 1)
+        self.assertEqual(data["conditions"]["USED"], {"items": 1, "units": 6})
+        self.assertEqual(data["last_restock_date"], datetime.now().date().isoformat())
+
+    def test_get_product_etag(self):
+        """It should return 304 for an unchanged product and a new ETag after a write"""
+        Inventory(id=7, name="tagged", quantity=1, restock_level=5).create()
+        resp = self.client.get(f"{BASE_URL}/7")
+        etag = resp.headers["ETag"]
+        self.assertTrue(etag.startswith('"'))
+        resp = self.client.get(f"{BASE_URL}/7", headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(resp.headers["ETag"], etag)
+        self.assertEqual(resp.get_data(), b"")
+
+        self.client.put(f"{BASE_URL}/7/restock")
+        resp = self.client.get(f"{BASE_URL}/7", headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(resp.headers["ETag"], etag)
+
+    def test_list_products_etag(self):
+        """It should return 304 for an unchanged list and 200 once it changes"""
+        self._create_products(3)
+        resp = self.client.get(BASE_URL, query_string="limit=2")
+        etag = resp.headers["ETag"]
+        resp = self.client.get(BASE_URL, query_string="limit=2", headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        resp = self.client.get(BASE_URL, query_string="limit=1", headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+        self.client.put(f"{BASE_URL}/3/restock")
+        resp = self.client.get(BASE_URL, query_string="limit=2", headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        etag = resp.headers["ETag"]
+        self.client.delete(f"{BASE_URL}/1")
+        resp = self.client.get(BASE_URL, query_string="limit=2", headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+    def test_list_products_etag_per_page(self):
+        """It should change a list ETag only for changes to that page"""
+        self._create_products(5)
+        etag = self.client.get(BASE_URL, query_string="limit=2").headers["ETag"]
+        self.client.put(f"{BASE_URL}/5/restock")
+        resp = self.client.get(BASE_URL, query_string="limit=2", headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        # the first product after the page decides its next page link
+        self.client.delete(f"{BASE_URL}/3")
+        resp = self.client.get(BASE_URL, query_string="limit=2", headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
     def test_update_product(self):
         """It should Update an existing product"""
 
@@ -228,6 +484,67 @@ class TestYourResourceServer(TestCase):
         self.assertEqual(updated_product["restock_count"], 0)
         self.assertEqual(updated_product["condition"], "USED")
 
+    def test_update_product_if_match(self):
+        """It should only Update a product whose version matches If-Match"""
+        Inventory(id=4, name="first", quantity=1).create()
+        resp = self.client.get(f"{BASE_URL}/4")
+        etag = resp.headers["ETag"]
+        item = resp.get_json()
+
+        item["name"] = "second"
+        resp = self.client.put(f"{BASE_URL}/4", json=item, headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        new_etag = resp.headers["ETag"]
+        self.assertNotEqual(new_etag, etag)
+
+        item["name"] = "lost update"
+        resp = self.client.put(f"{BASE_URL}/4", json=item, headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        resp = self.client.put(f"{BASE_URL}/4/restock", headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        resp = self.client.put(f"{BASE_URL}/4/restock", headers={"If-Match": '"garbage"'})
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        version = new_etag.strip('"').split("-")[0]
+        resp = self.client.put(f"{BASE_URL}/4", json=item, headers={"If-Match": f'"{version}-garbage"'})
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(self.client.get(f"{BASE_URL}/4").get_json()["name"], "second")
+
+        resp = self.client.put(f"{BASE_URL}/4/restock", headers={"If-Match": new_etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        resp = self.client.put(f"{BASE_URL}/4", json=item, headers={"If-Match": "*"})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        resp = self.client.put(f"{BASE_URL}/5", json=item, headers={"If-Match": new_etag})
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_update_recreated_product_if_match(self):
+        """It should not Update a recreated product with the ETag of the deleted one"""
+        Inventory(id=6, name="first", quantity=1).create()
+        etag = self.client.get(f"{BASE_URL}/6").headers["ETag"]
+        item = self.client.get(f"{BASE_URL}/6").get_json()
+        self.client.delete(f"{BASE_URL}/6")
+        Inventory(id=6, name="second", quantity=1).create()
+        resp = self.client.put(f"{BASE_URL}/6", json=item, headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        resp = self.client.put(f"{BASE_URL}/6/restock", headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(self.client.get(f"{BASE_URL}/6").get_json()["name"], "second")
+
+    def test_update_product_upsert(self):
+        """It should create a missing product on PUT with upsert=true"""
+        item = ProductFactory().serialize()
+        item["id"] = 6
+        resp = self.client.put(f"{BASE_URL}/6", json=item)
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+        resp = self.client.put(f"{BASE_URL}/6", json=item, query_string="upsert=true")
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(resp.headers["Location"].endswith(f"{BASE_URL}/6"))
+        self.assertEqual(resp.get_json()["name"], item["name"])
+        item["quantity"] += 1
+        resp = self.client.put(f"{BASE_URL}/6", json=item, query_string="upsert=true")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json()["quantity"], item["quantity"])
+        self.assertEqual(resp.headers["ETag"], self.client.get(f"{BASE_URL}/6").headers["ETag"])
+
     def test_bad_update(self):
         """Update nonexistent product and bad data, should raise 404 and 415"""
         test_product = ProductFactory()
@@ -292,6 +609,134 @@ class TestYourResourceServer(TestCase):
         data = resp.get_json()
         self.assertEqual(len(data), 5)
 
+    def test_list_products_paginated(self):
+        """It should List products one page at a time following the next links"""
+        self._create_products(7)
+        seen = []
+        url, query_string = BASE_URL, "limit=3"
+        pages = 0
+        while url:
+            resp = self.client.get(url, query_string=query_string)
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            seen.extend(item["id"] for item in resp.get_json())
+            pages += 1
+            url, query_string = None, None
+            if "Link" in resp.headers:
+                url = resp.headers["Link"].split(";")[0].strip("<>")
+        self.assertEqual(pages, 3)
+        self.assertEqual(seen, list(range(1, 8)))
+
+    def test_list_products_paginated_with_filters(self):
+        """It should keep the filters when following the next link"""
+        for iid in range(1, 7):
+            Inventory(id=iid, quantity=iid % 2).create()
+        resp = self.client.get(BASE_URL, query_string="quantity=1&limit=2")
+        self.assertEqual([item["id"] for item in resp.get_json()], [1, 3])
+        next_url = resp.headers["Link"].split(";")[0].strip("<>")
+        self.assertIn("quantity=1", next_url)
+        resp = self.client.get(next_url)
+        self.assertEqual([item["id"] for item in resp.get_json()], [5])
+        self.assertNotIn("Link", resp.headers)
+
+    def test_list_products_sparse_fields(self):
+        """It should List only the requested fields and keep them on the next link"""
+        self._create_products(3)
+        resp = self.client.get(BASE_URL, query_string="fields=quantity,restock_level&limit=2")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual([set(item) for item in data], [{"id", "quantity", "restock_level"}] * 2)
+        next_url = resp.headers["Link"].split(";")[0].strip("<>")
+        resp = self.client.get(next_url)
+        self.assertEqual(resp.get_json()[0]["id"], 3)
+        self.assertEqual(set(resp.get_json()[0]), {"id", "quantity", "restock_level"})
+
+    def test_list_products_bad_fields(self):
+        """It should not List products with unknown fields"""
+        resp = self.client.get(BASE_URL, query_string="fields=id,price")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("price", resp.get_json()["message"])
+
+    def test_list_products_with_operators(self):
+        """It should List products with range filters and reject bad ones"""
+        for iid in range(1, 6):
+            Inventory(id=iid, quantity=iid).create()
+        resp = self.client.get(BASE_URL, query_string="quantity__gte=2&quantity__lt=4")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual([item["id"] for item in resp.get_json()], [2, 3])
+        resp = self.client.get(BASE_URL, query_string="quantity__near=2")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.client.get(BASE_URL, query_string="color=red")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_products_reuses_statements(self):
+        """It should reuse the statement of a query shape seen before"""
+        Inventory(id=1, quantity=3).create()
+        self.client.get(BASE_URL, query_string="quantity__lt=5&limit=2")
+        stats = self.client.get("/stats/statements").get_json()
+        resp = self.client.get(BASE_URL, query_string="limit=7&quantity__lt=2")
+        self.assertEqual(resp.get_json(), [])
+        after = self.client.get("/stats/statements").get_json()
+        self.assertEqual(after["hits"] - stats["hits"], 2)
+        self.assertEqual(after["misses"], stats["misses"])
+
+    def test_list_products_page_size_capped(self):
+        """It should never return more than the maximum page size"""
+        self._create_products(4)
+        max_size = app.config["MAX_PAGE_SIZE"]
+        app.config["MAX_PAGE_SIZE"] = 2
+        try:
+            resp = self.client.get(BASE_URL)
+            self.assertEqual(len(resp.get_json()), 2)
+            self.assertIn("Link", resp.headers)
+            resp = self.client.get(BASE_URL, query_string="limit=500")
+            self.assertEqual(len(resp.get_json()), 2)
+        finally:
+            app.config["MAX_PAGE_SIZE"] = max_size
+
+    def test_list_products_bad_paging(self):
+        """It should reject bad limits and cursors"""
+        for query_string in ("limit=0", "limit=ten", "cursor=bm9wZQ", "cursor=W10=", "cursor=eyJpZCI6ICJ4In0="):
+            resp = self.client.get(BASE_URL, query_string=query_string)
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST, query_string)
+
+    def test_list_low_stock(self):
+        """It should List products below their restock level, largest shortfall first"""
+        levels = {1: (5, 10), 2: (10, 10), 3: (0, 3), 4: (1, 9), 5: (2, 7), 6: (20, 1)}
+        for iid, (quantity, level) in levels.items():
+            Inventory(id=iid, quantity=quantity, restock_level=level).create()
+        resp = self.client.get(f"{BASE_URL}/low-stock")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual([item["id"] for item in resp.get_json()], [4, 5, 1, 3])
+        self.assertNotIn("Link", resp.headers)
+
+        seen = []
+        resp = self.client.get(f"{BASE_URL}/low-stock", query_string="limit=1")
+        while True:
+            seen.extend(item["id"] for item in resp.get_json())
+            if "Link" not in resp.headers:
+                break
+            resp = self.client.get(resp.headers["Link"].split(";")[0].strip("<>"))
+        self.assertEqual(seen, [4, 5, 1, 3])
+
+    def test_list_low_stock_bad_cursor(self):
+        """It should reject a cursor that does not hold a shortfall"""
+        resp = self.client.get(f"{BASE_URL}/low-stock", query_string="cursor=eyJpZCI6IDF9")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_products(self):
+        """It should Stream products as newline delimited JSON"""
+        for iid in range(1, 6):
+            Inventory(id=iid, quantity=iid % 2).create()
+        resp = self.client.get(f"{BASE_URL}/export")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.mimetype, "application/x-ndjson")
+        lines = resp.get_data(as_text=True).splitlines()
+        self.assertEqual([json.loads(line)["id"] for line in lines], [1, 2, 3, 4, 5])
+
+        resp = self.client.get(f"{BASE_URL}/export", query_string="quantity=0")
+        lines = resp.get_data(as_text=True).splitlines()
+        self.assertEqual([json.loads(line)["id"] for line in lines], [2, 4])
+
     def test_query_by_condition(self):
         """It should Query inventory items by Condition"""
         products = self._create_products(3)
@@ -376,6 +821,43 @@ class TestYourResourceServer(TestCase):
         response = self.client.put(f"{BASE_URL}/{id_bad}/restock")
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+    def test_restock_in_bulk(self):
+        """It should Restock the products matching ids or filters"""
+        Inventory(id=1, quantity=2, restock_level=10, restock_count=5, condition=Condition.NEW).create()
+        Inventory(id=2, quantity=20, restock_level=10, restock_count=5, condition=Condition.NEW).create()
+        Inventory(id=3, quantity=0, restock_level=4, restock_count=5, condition=Condition.USED).create()
+
+        response = self.client.post(f"{BASE_URL}/restock", query_string="condition=NEW")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(data["restocked"], 2)
+        self.assertEqual(data["total_added"], 13)
+        self.assertEqual(
+            data["results"],
+            [{"id": 1, "added": 8, "quantity": 10}, {"id": 2, "added": 5, "quantity": 25}],
+        )
+        self.assertEqual(self.client.get(f"{BASE_URL}/3").get_json()["quantity"], 0)
+
+        response = self.client.post(f"{BASE_URL}/restock", json={"ids": [2, 3, 99]})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(data["restocked"], 2)
+        self.assertEqual([result["id"] for result in data["results"]], [2, 3])
+        self.assertEqual(self.client.get(f"{BASE_URL}/3").get_json()["quantity"], 4)
+
+    def test_restock_in_bulk_bad_request(self):
+        """It should not Restock in bulk without ids or filters, or with too many ids"""
+        response = self.client.post(f"{BASE_URL}/restock")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(f"{BASE_URL}/restock", json={"ids": ["one"]})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(f"{BASE_URL}/restock", json=[1, 2])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        with patch("service.routes.IN_CLAUSE_BATCH_SIZE", 2):
+            response = self.client.post(f"{BASE_URL}/restock", json={"ids": [1, 2, 3]})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("At most 2 ids", response.get_json()["message"])
+
     def test_query_by_quantity(self):
         """It should Query inventory items by quantity"""
 
@@ -462,3 +944,27 @@ class TestYourResourceServer(TestCase):
         self.assertEqual(resp.status_code, 200)
         data = resp.get_json()
         self.assertEqual(data["status"], "OK")
+
+    def test_health_database_unreachable(self):
+        """It should answer 503 while the database cannot be reached"""
+        saved = {key: app.config[key] for key in ("RETRY_COUNT", "RETRY_DELAY")}
+        app.config.update(RETRY_COUNT=3, RETRY_DELAY=0)
+        error = exc.OperationalError("SELECT 1", {}, Exception("connection refused"))
+        try:
+            with patch.object(Inventory, "ready", False), patch.object(db.engine, "connect", side_effect=error) as connect:
+                resp = self.client.get("/health")
+                self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+                # the health check makes a single attempt
+                self.assertEqual(connect.call_count, 1)
+                resp = self.client.get(f"{BASE_URL}/1")
+                self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+                self.assertEqual(connect.call_count, 4)
+                self.assertIn("after 3 attempts", resp.get_json()["message"])
+                # endpoints that do not need the database are still served
+                self.assertEqual(self.client.get("/stats/cache").status_code, status.HTTP_200_OK)
+                self.assertEqual(self.client.get("/metrics").status_code, status.HTTP_200_OK)
+                self.assertEqual(connect.call_count, 4)
+        finally:
+            app.config.update(saved)
+        self.assertEqual(self.client.get("/health").status_code, status.HTTP_200_OK)
+        self.assertTrue(Inventory.ready)
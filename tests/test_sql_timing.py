@@ -0,0 +1,60 @@
+"""
+Test cases for the SQL timing of requests
+
+"""
+from unittest import TestCase
+from unittest.mock import MagicMock, call
+from service.common.sql_timing import explain
+
+
+######################################################################
+#  E X P L A I N   T E S T   C A S E S
+######################################################################
+class TestExplain(TestCase):
+    """Test Cases for explain()"""
+
+    def setUp(self):
+        self.connection = MagicMock(autocommit=False)
+        self.cursor = self.connection.cursor.return_value
+
+    def test_explain_in_savepoint(self):
+        """It should read a PostgreSQL plan inside a savepoint"""
+        self.cursor.fetchall.return_value = [("Seq Scan on inventory",)]
+        plan = explain("postgresql", self.connection, "SELECT * FROM inventory WHERE id = %(id)s", {"id": 1})
+        self.assertEqual(plan, "Seq Scan on inventory")
+        self.assertEqual(
+            self.cursor.execute.call_args_list,
+            [
+                call("SAVEPOINT explain_plan"),
+                call("EXPLAIN SELECT * FROM inventory WHERE id = %(id)s", {"id": 1}),
+                call("RELEASE SAVEPOINT explain_plan"),
+            ],
+        )
+        self.cursor.close.assert_called_once()
+
+    def test_explain_failure_rolls_back(self):
+        """It should roll back to the savepoint when EXPLAIN fails"""
+
+        def execute(sql, *_args):
+            if sql.startswith("EXPLAIN"):
+                raise ValueError("syntax error")
+
+        self.cursor.execute.side_effect = execute
+        self.assertIsNone(explain("postgresql", self.connection, "SELECT bad", {}))
+        self.assertEqual(
+            [args[0][0] for args in self.cursor.execute.call_args_list],
+            ["SAVEPOINT explain_plan", "EXPLAIN SELECT bad", "ROLLBACK TO SAVEPOINT explain_plan",
+             "RELEASE SAVEPOINT explain_plan"],
+        )
+
+    def test_explain_without_savepoint(self):
+        """It should not use a savepoint on SQLite, in autocommit or for other statements"""
+        self.cursor.fetchall.return_value = [(2, 0, 0, "SCAN inventory")]
+        self.assertEqual(explain("sqlite", self.connection, "SELECT 1", ()), "SCAN inventory")
+        self.connection.autocommit = True
+        explain("postgresql", self.connection, "SELECT 1", {})
+        self.assertEqual(
+            [args[0][0] for args in self.cursor.execute.call_args_list],
+            ["EXPLAIN QUERY PLAN SELECT 1", "EXPLAIN SELECT 1"],
+        )
+        self.assertIsNone(explain("postgresql", self.connection, "CREATE TABLE t (id int)", {}))